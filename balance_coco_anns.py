@@ -1,170 +1,285 @@
-import copy
 import os
 import sys
 import shutil
 import argparse
 import json
-from shutil import copyfile
-
-
-def collect_annotations_per_frame(coco_data):
-    categories = {x['id']: x['name'] for x in coco_data['categories']}
-    objects_frame_dict = {x['id']: {a: 0 for a in categories.values()} for x in coco_data['images']}
-    frames_len = len(coco_data['images'])
-    last_frame_idx = 0  # Annotations are ordered according per image, so this makes indexing faster
-    for frame_idx, frame in enumerate(coco_data['images']):
-        if frame_idx % 100 == 0:
-            print(f"{frame_idx}/{frames_len}")
-        for ann_idx in range(last_frame_idx, len(coco_data['annotations'])):
-            ann = coco_data['annotations'][ann_idx]
-            if frame['id'] == ann['image_id']:
-                object_class = categories[ann['category_id']]
-                objects_frame_dict[frame['id']][object_class] += 1
-            else:
-                last_frame_idx = ann_idx
-                break
-    return objects_frame_dict
+import heapq
+import numpy as np
+from collections import Counter
+
+from coco_index import CocoIndex
+
+FICLONE = 0x40049409  # Linux ioctl that makes dst share src's data blocks (btrfs, XFS, ...)
+RATIO_TOLERANCE = 0.01  # --ratios searches stop once the class proportions are this close (L1) to the target
+
+
+def collect_annotations_per_frame(coco_index):
+    """Count the annotations of each category on each frame.
+
+    Annotations may come in any order, and any set of categories is supported.
+
+    Returns:
+        tuple -- (image_ids, category_names, frame_counts), where frame_counts[i, j] is the number of annotations of
+                 category_names[j] on the frame with id image_ids[i].
+    """
+    return coco_index.image_ids.tolist(), coco_index.category_names, coco_index.count_annotations_per_image()
+
+
+def get_ratio_error(totals, target):
+    # L1 distance between the class proportions of each row of totals and the target proportions
+    with np.errstate(invalid='ignore', divide='ignore'):
+        error = np.abs(totals / totals.sum(axis=-1, keepdims=True) - target).sum(axis=-1)
+    return np.where(np.isnan(error), np.inf, error)
+
+
+def solve_frame_factors(frame_counts, target_ratios, sample_type, max_repeats=10, tolerance=RATIO_TOLERANCE,
+                        max_rounds=10000):
+    """Choose which frames to repeat (oversample) or drop (undersample) so the class totals approach target_ratios.
+
+    Greedy over the whole frames x classes matrix at once: every round ranks the frames by the ratio error they would
+    leave if repeated/dropped alone, and takes the prefix of that ranking that brings the totals closest to the target.
+    Rounds stop once the proportions are within tolerance of the target or no frame improves them. Frames can be
+    repeated in several rounds, up to max_repeats times each so the repeats are spread over the candidate frames
+    instead of piling up on the few that point best towards the target, and dropped only once.
+
+    Arguments:
+        frame_counts {np.ndarray} -- frames x classes annotation counts, see collect_annotations_per_frame.
+        target_ratios {np.ndarray} -- Relative amount wanted of each class (column), e.g. [2, 1] for twice as many of
+                                      the first class as of the second.
+        sample_type {str} -- "oversample" or "undersample".
+        max_repeats {int} -- Times a single frame can be repeated (oversample only).
+        tolerance {float} -- L1 distance to the target proportions that is close enough.
+        max_rounds {int} -- Upper bound on the number of greedy rounds, a warning is printed when it is reached.
+
+    Returns:
+        tuple -- (frame_factors, totals): times each frame is repeated (oversample) or 1 for dropped frames
+                 (undersample), and the class totals they result in.
+    """
+    target = np.asarray(target_ratios, dtype=np.float64)
+    target = target / target.sum()
+    frame_counts = frame_counts.astype(np.float64)
+    sign = 1 if sample_type == 'oversample' else -1
+    max_factor = max_repeats if sample_type == 'oversample' else 1
+    frame_factors = np.zeros(len(frame_counts), dtype=np.int64)
+    totals = frame_counts.sum(axis=0)
+    error = get_ratio_error(totals, target)
+    for _ in range(max_rounds):
+        if error <= tolerance:
+            break
+        single_errors = get_ratio_error(totals + sign * frame_counts, target)
+        candidates = np.flatnonzero((single_errors < error) & (frame_factors < max_factor))
+        if len(candidates) == 0:
+            break
+        ranking = candidates[np.argsort(single_errors[candidates], kind='stable')]
+        new_totals = totals + sign * np.cumsum(frame_counts[ranking], axis=0)
+        new_errors = get_ratio_error(new_totals, target)
+        best = int(np.argmin(new_errors))
+        if new_errors[best] >= error:
+            break
+        frame_factors[ranking[:best + 1]] += 1
+        totals = new_totals[best]
+        error = new_errors[best]
+    else:
+        print(f"Warning: stopped after {max_rounds} rounds, the class ratios may still improve")
+    return frame_factors, totals
+
+
+def parse_ratios(ratios, category_names):
+    # ["vehicle=2", "pedestrian=1"] -> ([column of vehicle, column of pedestrian], [2., 1.])
+    columns = []
+    target_ratios = []
+    for ratio in ratios:
+        name, value = ratio.split('=')
+        if name not in category_names:
+            raise ValueError("Category %s is not on the annotations file (%s)." % (name, ", ".join(category_names)))
+        columns.append(category_names.index(name))
+        target_ratios.append(float(value))
+    return columns, target_ratios
+
+
+def balance_frames(frame_counts, category_names, ratios, sample_type, max_repeats=10):
+    """Solve frame repeats/drops for the --ratios targets and report the class ratios and repeats they result in."""
+    columns, target_ratios = parse_ratios(ratios, category_names)
+    frame_factors, totals = solve_frame_factors(frame_counts[:, columns], target_ratios, sample_type, max_repeats)
+    totals_before = frame_counts[:, columns].sum(axis=0)
+    target = np.asarray(target_ratios) / sum(target_ratios)
+    print(f"{'category':<15} {'before':>10} {'after':>10} {'achieved':>9} {'target':>9}")
+    for idx, column in enumerate(columns):
+        print(f"{category_names[column]:<15} {int(totals_before[idx]):>10} {int(totals[idx]):>10} "
+              f"{totals[idx] / totals.sum():>9.3f} {target[idx]:>9.3f}")
+    error = get_ratio_error(totals, target)
+    if error > RATIO_TOLERANCE:
+        print(f"Warning: the target ratios were not reached (L1 error {error:.3f})" +
+              (", a higher --max_repeats may get closer" if sample_type == 'oversample' else ""))
+    if sample_type == 'oversample':
+        repeated = frame_factors[frame_factors > 0]
+        print(f"{len(repeated)} of {len(frame_factors)} frames repeated" +
+              (f", {repeated.min()}-{repeated.max()} times each (median {np.median(repeated):g})" if len(repeated) else ""))
+    action = "repeated" if sample_type == 'oversample' else "excluded"
+    print(f"{int(frame_factors.sum())} frames should be {action}.")
+    return frame_factors
+
+
+def materialize_image(src, dst, materialize):
+    """Create dst as a copy of image src, with "copy", "hardlink", "symlink" or "reflink"."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if materialize == 'copy':
+        shutil.copy(src, dst)
+    elif materialize == 'hardlink':
+        os.link(src, dst)
+    elif materialize == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+    elif materialize == 'reflink':
+        try:
+            import fcntl
+            with open(src, 'rb') as src_f, open(dst, 'wb') as dst_f:
+                fcntl.ioctl(dst_f.fileno(), FICLONE, src_f.fileno())
+        except (ImportError, OSError):
+            # Not supported by the platform/filesystem (or src and dst are on different filesystems)
+            shutil.copy(src, dst)
+    else:
+        raise ValueError("Unknown materialize option %s." % materialize)
 
 
 def undersample(args):
     def find_frames_to_exclude():
-        # First find what is the difference between vehicles and pedestrians per frame
-        vehicle_counts = {}
-        pedestrian_counts = {}
-        for frame in objects_frame_dict:
-            vehicles = objects_frame_dict[frame]['vehicle']
-            pedestrians = objects_frame_dict[frame]['pedestrian']
-            vehicle_counts[frame] = vehicles
-            pedestrian_counts[frame] = pedestrians
+        # A frame's surplus is how far its vehicles outweigh its pedestrians for the target ratio. Dropping the frames
+        # with the largest surplus first gets to the ratio while removing as few frames as possible
+        vehicle_counts = frame_counts[:, category_names.index('vehicle')].tolist()
+        pedestrian_counts = frame_counts[:, category_names.index('pedestrian')].tolist()
+        vehicles = sum(vehicle_counts)
+        pedestrians = sum(pedestrian_counts)
+        surplus_heap = []
+        for frame_idx, (frame_vehicles, frame_pedestrians) in enumerate(zip(vehicle_counts, pedestrian_counts)):
+            surplus = frame_vehicles * args.thresh/100 - frame_pedestrians
+            if surplus > 0:
+                surplus_heap.append((-surplus, frame_idx))
+        heapq.heapify(surplus_heap)
 
         frames_to_exclude = []
-        for frame in objects_frame_dict:
-            vehicles = sum(vehicle_counts.values())
-            pedestrians = sum(pedestrian_counts.values())
-            print(f'vehic {vehicles} peds {pedestrians} threshold {vehicles*args.thresh/100}')
-            if pedestrians > vehicles * args.thresh/100:
-                break
-            if objects_frame_dict[frame]['vehicle'] > objects_frame_dict[frame]['pedestrian']:
-                frames_to_exclude.append(frame)
-                del vehicle_counts[frame]
-                del pedestrian_counts[frame]
+        while surplus_heap and pedestrians <= vehicles * args.thresh/100:
+            _, frame_idx = heapq.heappop(surplus_heap)
+            frames_to_exclude.append(image_ids[frame_idx])
+            vehicles -= vehicle_counts[frame_idx]
+            pedestrians -= pedestrian_counts[frame_idx]
+        print(f'vehic {vehicles} peds {pedestrians} threshold {vehicles*args.thresh/100}')
+        if pedestrians <= vehicles * args.thresh/100:
+            print(f'Warning: no frames left to exclude, the --thresh {args.thresh} ratio was not reached')
+        print(f"{len(frames_to_exclude)} frames should be excluded.")
         return frames_to_exclude
 
     def remove_entries_from_new_coco(frames_to_exclude):
-        with open(args.out, 'r') as f:
-            new_coco_data = json.load(f)
-
-        new_images = [x for x in new_coco_data['images'] if x['id'] not in frames_to_exclude]
-        new_anns = [x for x in new_coco_data['annotations'] if x['image_id'] not in frames_to_exclude]
-        new_coco_data['images'] = new_images
-        new_coco_data['annotations'] = new_anns
+        frames_to_exclude = set(frames_to_exclude)
+        coco_data['images'] = [x for x in coco_data['images'] if x['id'] not in frames_to_exclude]
+        coco_data['annotations'] = [x for x in coco_data['annotations'] if x['image_id'] not in frames_to_exclude]
         with open(args.out, 'w') as f:
-            json.dump(new_coco_data, f)
+            json.dump(coco_data, f)
 
     # Data preprocessing
     with open(args.anns, 'r') as f:
         coco_data = json.load(f)
-    copyfile(args.anns, args.out)
     # Collecting all annotations PER FRAME at first
-    objects_frame_dict = collect_annotations_per_frame(coco_data)
+    coco_index = CocoIndex(coco_data)
+    image_ids, category_names, frame_counts = collect_annotations_per_frame(coco_index)
     # Removing frames where n_vehicles >> n_pedestrians, trying to keep the balance
-    frames_to_exclude = find_frames_to_exclude()
+    if args.ratios is None:
+        frames_to_exclude = find_frames_to_exclude()
+    else:
+        frame_factors = balance_frames(frame_counts, category_names, args.ratios, 'undersample')
+        frames_to_exclude = [image_ids[idx] for idx in np.flatnonzero(frame_factors)]
     remove_entries_from_new_coco(frames_to_exclude)
 
 
 def oversample(args):
     def find_frames_to_add():
         # First find what is the difference between vehicles and pedestrians per frame
-        frames_to_consider = []
-        vehicle_counts = []
-        pedestrian_counts = []
-        category_difference = {}
-        for frame in objects_frame_dict:
-            vehicles = objects_frame_dict[frame]['vehicle']
-            pedestrians = objects_frame_dict[frame]['pedestrian']
-            if vehicles < pedestrians:
-                frames_to_consider.append(frame)
-            vehicle_counts.append(vehicles)
-            pedestrian_counts.append(pedestrians)
-            category_difference[frame] = vehicles-pedestrians
-
-        frames_more_pedestrians = [x for x in category_difference if category_difference[x] < 0]
-        new_vehicle_counts = sum(vehicle_counts)
-        new_pedestrian_counts = sum(pedestrian_counts)
+        vehicle_counts = dict(zip(image_ids, frame_counts[:, category_names.index('vehicle')].tolist()))
+        pedestrian_counts = dict(zip(image_ids, frame_counts[:, category_names.index('pedestrian')].tolist()))
+
+        frames_more_pedestrians = [x for x in image_ids if vehicle_counts[x] < pedestrian_counts[x]]
+        new_vehicle_counts = sum(vehicle_counts.values())
+        new_pedestrian_counts = sum(pedestrian_counts.values())
         frames_to_add = []
-        while True:
-            for count, frame in enumerate(frames_more_pedestrians):
+        if not frames_more_pedestrians:
+            print("Warning: no frame has more pedestrians than vehicles, nothing to repeat")
+            return frames_to_add
+        # Repeating these frames only moves the ratio towards their own pedestrians/vehicles ratio, so a threshold
+        # above it can never be reached
+        repeated_vehicles = sum(vehicle_counts[x] for x in frames_more_pedestrians)
+        repeated_pedestrians = sum(pedestrian_counts[x] for x in frames_more_pedestrians)
+        if (new_pedestrian_counts <= new_vehicle_counts * args.thresh / 100 and
+                repeated_pedestrians <= repeated_vehicles * args.thresh / 100):
+            print(f"Warning: the frames with more pedestrians than vehicles have a pedestrians/vehicles ratio of "
+                  f"{repeated_pedestrians / repeated_vehicles:.2f}, the --thresh {args.thresh} ratio can not be "
+                  f"reached, nothing to repeat")
+            return frames_to_add
+        while new_pedestrian_counts <= new_vehicle_counts * args.thresh / 100:
+            for frame in frames_more_pedestrians:
                 if new_pedestrian_counts > new_vehicle_counts * args.thresh / 100:
                     break
                 frames_to_add.append(frame)
-                new_vehicle_counts += objects_frame_dict[frame]['vehicle']
-                new_pedestrian_counts += objects_frame_dict[frame]['pedestrian']
-                print('new_vehicle_count', new_vehicle_counts,
-                      'new_pedestrian_count', new_pedestrian_counts,
-                      "minimum pedestrians necessary", new_vehicle_counts * args.thresh / 100)
-            if new_pedestrian_counts > new_vehicle_counts * args.thresh / 100:
-                break
+                new_vehicle_counts += vehicle_counts[frame]
+                new_pedestrian_counts += pedestrian_counts[frame]
+        print('new_vehicle_count', new_vehicle_counts,
+              'new_pedestrian_count', new_pedestrian_counts,
+              "minimum pedestrians necessary", new_vehicle_counts * args.thresh / 100)
         print(f"{len(frames_to_add)} frames should be repeated.")
         return frames_to_add
 
     def add_entries_to_new_coco(frames_to_add):
-        with open(args.anns, 'r') as f:
-            old_coco_data = json.load(f)
+        # Records are cloned shallowly, only the ids and file name of the copies change
+        images = coco_data['images']
+        if args.materialize == 'none':
+            # Metadata only: repeated frames stay once in the json, pointing at their original file_name, and say
+            # how many times they should be seen
+            for oversample_frame, repeats in Counter(frames_to_add).items():
+                images[coco_index.get_image_row(oversample_frame)]['repeat_count'] = 1 + repeats
+            with open(args.out, 'w') as f:
+                json.dump(coco_data, f)
+            return
 
-        # First gather all new data to be added, only after this increment to coco file
-        print('Copying repeated images and adding repeated annotations. This may take a while.')
+        print(f'Adding repeated annotations and images ({args.materialize}).')
         new_coco_data_images = []
         new_ann_list = []
-        new_ann_id_start = old_coco_data['annotations'][-1]['id']
-        ann_id_counter = 0
-        for repeated_frame_idx, oversample_frames in enumerate(frames_to_add):
-            sys.stdout.write("\r")
-            sys.stdout.write(f'Getting frame and annotations metadata {repeated_frame_idx}/{len(frames_to_add)}')
-            sys.stdout.flush()
-            for original_frame in old_coco_data['images']:
-                # Remember that an additional index number was added at the end of the repeated filename
-                # unix timestamp length is 15 digits, so everything that comes after is the additional idx
-                if str(oversample_frames)[0:16] == str(original_frame['id'])[0:16]:
-                    # Re-adding image metadata (and creating img)
-                    repeated_frame_metadata = copy.deepcopy(original_frame)
-                    repeated_frame_metadata['file_name'] = f"{oversample_frames}{repeated_frame_idx}.jpg"
-                    repeated_frame_metadata['id'] = int(f"{oversample_frames}{repeated_frame_idx}")
-                    new_coco_data_images.append(repeated_frame_metadata)
-
-                    # Re-adding annotations pertaining to the repeated frame
-                    for original_ann in old_coco_data['annotations']:
-                        if str(original_ann['image_id'])[0:16] == str(oversample_frames)[0:16]:
-                            new_ann = copy.deepcopy(original_ann)
-                            new_ann['image_id'] = repeated_frame_metadata['id']
-                            ann_id_counter += 1
-                            new_ann['id'] = new_ann_id_start + ann_id_counter
-                            new_ann_list.append(new_ann)
-                    continue  # There should be only one frame with equal name
-    
-        # Only now we add new data into COCO and also create the images. Inefficient, but probably safer
-        new_coco_data = copy.deepcopy(old_coco_data)
-        for img_idx, new_img_data in enumerate(new_coco_data_images):
+        new_ann_id = int(coco_index.ann_ids.max()) if len(coco_index.ann_ids) else 0
+        for repeated_frame_idx, oversample_frame in enumerate(frames_to_add):
+            # An additional index number is added at the end of the repeated frame id/filename
+            repeated_frame_metadata = dict(images[coco_index.get_image_row(oversample_frame)])
+            repeated_frame_metadata['file_name'] = f"{oversample_frame}{repeated_frame_idx}.jpg"
+            repeated_frame_metadata['id'] = int(f"{oversample_frame}{repeated_frame_idx}")
+            new_coco_data_images.append(repeated_frame_metadata)
+            for ann_row in coco_index.get_annotation_rows(coco_index.get_image_row(oversample_frame)):
+                new_ann_id += 1
+                new_ann = dict(coco_data['annotations'][ann_row])
+                new_ann['image_id'] = repeated_frame_metadata['id']
+                new_ann['id'] = new_ann_id
+                new_ann_list.append(new_ann)
+
+        for img_idx, (oversample_frame, new_img_data) in enumerate(zip(frames_to_add, new_coco_data_images)):
             sys.stdout.write("\r")
             sys.stdout.write(f'Creating new images {img_idx}/{len(new_coco_data_images)}')
             sys.stdout.flush()
-            new_coco_data['images'].append(new_img_data)
-            original_img_filename = str(new_img_data['id'])[0:16] + ".jpg"
-            shutil.copy(os.path.join(args.img_in_dir, original_img_filename),
-                        os.path.join(args.img_out_dir, new_img_data['file_name']))
-        for new_ann_data in new_ann_list:
-            new_coco_data['annotations'].append(new_ann_data)
+            materialize_image(os.path.join(args.img_in_dir, coco_index.file_names[coco_index.get_image_row(oversample_frame)]),
+                              os.path.join(args.img_out_dir, new_img_data['file_name']), args.materialize)
+        coco_data['images'].extend(new_coco_data_images)
+        coco_data['annotations'].extend(new_ann_list)
         with open(args.out, 'w') as f:
-            json.dump(new_coco_data, f)
+            json.dump(coco_data, f)
 
     # Add repeated images and anns to coco file, but with a final idx at the end to differentiate them
     # Data preprocessing
     with open(args.anns, 'r') as f:
         coco_data = json.load(f)
-    copyfile(args.anns, args.out)
     # Collecting all annotations PER FRAME at first
-    objects_frame_dict = collect_annotations_per_frame(coco_data)
+    coco_index = CocoIndex(coco_data)
+    image_ids, category_names, frame_counts = collect_annotations_per_frame(coco_index)
     # Finding which frames to (re)add to dataset
-    frames_to_add = find_frames_to_add()
+    if args.ratios is None:
+        frames_to_add = find_frames_to_add()
+    else:
+        frame_factors = balance_frames(frame_counts, category_names, args.ratios, 'oversample', args.max_repeats)
+        frames_to_add = [image_ids[idx] for idx in np.flatnonzero(frame_factors) for _ in range(frame_factors[idx])]
     add_entries_to_new_coco(frames_to_add)
 
 
@@ -185,10 +300,20 @@ if __name__ == "__main__":
     parser.add_argument("--img_in_dir", type=str, help="[ONLY FOR OVERSAMPLE SAMPLE TYPE] input images directory", default='/mnt/6EFE2115FE20D75D/Naoto/UFPR/Mestrado/9_Code/datasets/Waymo/skip10_dataset/imgs_jpg')
     parser.add_argument("--img_out_dir", type=str, help="[ONLY FOR OVERSAMPLE SAMPLE TYPE] specifies the directory where additional"
                                                         "image files are going to be created", default='test_dir')
+    parser.add_argument("--materialize", type=str, choices=["copy", "hardlink", "symlink", "reflink", "none"], default="copy",
+                        help="[ONLY FOR OVERSAMPLE SAMPLE TYPE] how repeated images are created in --img_out_dir;"
+                             "\"reflink\" falls back to copy when the filesystem does not support it;"
+                             "\"none\" creates no images nor new entries, repeated frames get a \"repeat_count\" field instead")
     parser.add_argument("--thresh", type=int, default=100,
                         help="set proportion of annotations between pedestrians and vehicles;"
                              "e.g.: --thresh 10 will ensure that the number of pedestrians is at least 10%% of vehicles;"
                              "--thresh 100 will make it so that they are roughly the same")
+    parser.add_argument("--ratios", type=str, nargs="+", default=None,
+                        help="balance any set of categories instead of using --thresh, as category=relative_amount;"
+                             "e.g.: --ratios vehicle=2 pedestrian=1 cyclist=1 sign=1 aims for twice as many vehicles as "
+                             "each of the other classes")
+    parser.add_argument("--max_repeats", type=int, default=10,
+                        help="[ONLY FOR OVERSAMPLE SAMPLE TYPE WITH --ratios] times a single frame can be repeated")
     args = parser.parse_args()
 
     assert args.sample_type == "oversample" or args.sample_type == "undersample"
@@ -0,0 +1,188 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import xml.etree.ElementTree as ET
+import xml.parsers.expat as expat
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from voc2coco_lib import parse_xml_file, get_filename_as_int
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+BNDBOX_TAGS = ("xmin", "ymin", "xmax", "ymax")
+
+
+def get_one(values, name, parent_tag):
+    # Same check and error as voc2coco_lib.get_and_check(parent, name, 1)
+    if len(values) == 0:
+        raise ValueError("Can not find %s in %s." % (name, parent_tag))
+    if len(values) != 1:
+        raise ValueError("The size of %s is supposed to be %d, but is %d." % (name, 1, len(values)))
+    return values[0]
+
+
+def records_from_fields(xml_file, root_tag, fields, objects):
+    # Every occurrence of each field is kept by the backends, so the same validation as parse_xml_file runs here:
+    # fields = {"path": [text, ...], "filename": [...], "size": [{"width": [...], "height": [...]}, ...]}
+    # objects = [{"name": [text, ...], "bndbox": [{"xmin": [text, ...], ...}, ...]}, ...]
+    if len(fields["path"]) == 1:
+        filename = os.path.basename(fields["path"][0])
+    elif len(fields["path"]) == 0:
+        filename = get_one(fields["filename"], "filename", root_tag)
+    else:
+        raise ValueError("%d paths found in %s" % (len(fields["path"]), xml_file))
+    image_id = get_filename_as_int(filename)
+    size = get_one(fields["size"], "size", root_tag)
+    width = int(get_one(size["width"], "width", "size"))
+    height = int(get_one(size["height"], "height", "size"))
+    records = []
+    for obj in objects:
+        name = get_one(obj["name"], "name", "object")
+        bndbox = get_one(obj["bndbox"], "bndbox", "object")
+        xmin = int(get_one(bndbox["xmin"], "xmin", "bndbox")) - 1
+        ymin = int(get_one(bndbox["ymin"], "ymin", "bndbox")) - 1
+        xmax = int(get_one(bndbox["xmax"], "xmax", "bndbox"))
+        ymax = int(get_one(bndbox["ymax"], "ymax", "bndbox"))
+        assert xmax > xmin
+        assert ymax > ymin
+        records.append((name, xmin, ymin, xmax, ymax))
+    return filename, image_id, width, height, records
+
+
+def walk_tree(xml_file, root):
+    # Visits every element once instead of calling findall per field
+    fields = {"path": [], "filename": [], "size": []}
+    objects = []
+    for child in root:
+        tag = child.tag
+        if tag == "object":
+            obj = {"name": [], "bndbox": []}
+            for obj_child in child:
+                if obj_child.tag == "name":
+                    obj["name"].append(obj_child.text)
+                elif obj_child.tag == "bndbox":
+                    bndbox = {x: [] for x in BNDBOX_TAGS}
+                    for bndbox_child in obj_child:
+                        if bndbox_child.tag in bndbox:
+                            bndbox[bndbox_child.tag].append(bndbox_child.text)
+                    obj["bndbox"].append(bndbox)
+            objects.append(obj)
+        elif tag == "path" or tag == "filename":
+            fields[tag].append(child.text)
+        elif tag == "size":
+            size = {"width": [], "height": []}
+            for size_child in child:
+                if size_child.tag in size:
+                    size[size_child.tag].append(size_child.text)
+            fields["size"].append(size)
+    return records_from_fields(xml_file, root.tag, fields, objects)
+
+
+def parse_single_pass(xml_file):
+    return walk_tree(xml_file, ET.parse(xml_file).getroot())
+
+
+def parse_lxml(xml_file):
+    return walk_tree(xml_file, lxml_etree.parse(xml_file).getroot())
+
+
+def parse_expat(xml_file):
+    # State machine over expat events, no tree is built
+    stack = []
+    text = []
+    root_tags = []
+    fields = {"path": [], "filename": [], "size": []}
+    objects = []
+
+    def start(tag, attrs):
+        stack.append(tag)
+        text.clear()
+        depth = len(stack)
+        if depth == 1:
+            root_tags.append(tag)
+        elif depth == 2:
+            if tag == "object":
+                objects.append({"name": [], "bndbox": []})
+            elif tag == "size":
+                fields["size"].append({"width": [], "height": []})
+        elif depth == 3 and stack[1] == "object" and tag == "bndbox":
+            objects[-1]["bndbox"].append({x: [] for x in BNDBOX_TAGS})
+
+    def end(tag):
+        stack.pop()
+        depth = len(stack)
+        if depth == 1:
+            if tag == "path" or tag == "filename":
+                fields[tag].append("".join(text))
+        elif depth == 2:
+            if stack[1] == "size" and tag in ("width", "height"):
+                fields["size"][-1][tag].append("".join(text))
+            elif stack[1] == "object" and tag == "name":
+                objects[-1]["name"].append("".join(text))
+        elif depth == 3 and stack[1] == "object" and stack[2] == "bndbox" and tag in BNDBOX_TAGS:
+            objects[-1]["bndbox"][-1][tag].append("".join(text))
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text.append
+    with open(xml_file, "rb") as f:
+        parser.ParseFile(f)
+    return records_from_fields(xml_file, root_tags[0], fields, objects)
+
+
+def parse_or_error(parser, xml_file):
+    # Record of the file, or the error it raised, so backends can be checked to reject the same files
+    try:
+        return parser(xml_file)
+    except (ValueError, AssertionError) as e:
+        return type(e), str(e)
+
+
+def time_parser(parser, xml_files, repeat):
+    # Best of several runs, so that the disk cache is warm and other processes add as little noise as possible
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for xml_file in xml_files:
+            parser(xml_file)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of VOC xml parsing backends against the "
+                                                 "get/get_and_check path used by voc2coco_lib.parse_xml_file")
+    parser.add_argument("xml_dir", type=str, help="Directory with VOC xml files")
+    parser.add_argument("--max_files", type=int, default=10000, help="Number of xml files to parse per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs, the fastest one is reported")
+    args = parser.parse_args()
+
+    xml_files = sorted(glob.glob(os.path.join(args.xml_dir, "*.xml")))[:args.max_files]
+    backends = {"single pass (ElementTree)": parse_single_pass, "expat state machine": parse_expat}
+    if lxml_etree is not None:
+        backends["single pass (lxml)"] = parse_lxml
+    invalid_files = set()
+    for xml_file in xml_files:
+        expected = parse_or_error(parse_xml_file, xml_file)
+        for name, backend in backends.items():
+            assert parse_or_error(backend, xml_file) == expected, f"{name} disagrees on {xml_file}"
+        if not isinstance(expected[0], str):
+            invalid_files.add(xml_file)
+    if invalid_files:
+        # Every backend rejects them the same way, only valid files are timed
+        print(f"{len(invalid_files)} invalid xml files left out of the timings")
+        xml_files = [x for x in xml_files if x not in invalid_files]
+
+    print(f"{len(xml_files)} xml files, best of {args.repeat} runs")
+    baseline = time_parser(parse_xml_file, xml_files, args.repeat)
+    print(f"get/get_and_check (findall): {baseline:.3f}s, {len(xml_files) / baseline:.0f} files/s")
+    for name, backend in backends.items():
+        elapsed = time_parser(backend, xml_files, args.repeat)
+        print(f"{name}: {elapsed:.3f}s, {len(xml_files) / elapsed:.0f} files/s ({baseline / elapsed:.2f}x)")
@@ -0,0 +1,181 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import tracemalloc
+import contextlib
+import subprocess
+import importlib.util
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+from voc2coco_lib import parse_xml_files, write_coco_json
+from synthetic_voc import create_synthetic_voc_dir, DEFAULT_CLASSES
+
+# Conversion scripts and how they are called: "convert" takes (xml_files, json_file), "splits" takes {json_file: xml_files}
+CONVERSION_SCRIPTS = {
+    "convert_voc_to_coco.py": "splits",
+    "convert_voc_to_coco_no_split.py": "convert",
+    "convert_voc_to_coco_waymov120.py": "splits",
+    "voc2coco/voc2coco_all.py": "convert",
+    "voc2coco/voc2coco_kfold.py": "splits",
+    "voc2coco/voc2coco_train_val.py": "splits",
+    "voc2coco/voc2coco_train_val_test.py": "splits",
+    "voc2coco/voc2coco_trainval_split_by_frame_count.py": "splits",
+    "voc2coco/voc2coco_with_db_kfold_5.py": "splits",
+}
+
+
+def load_script(script):
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(script))[0],
+                                                  os.path.join(ROOT_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, *args):
+    # Time is measured on a run without tracemalloc, which slows down allocations considerably
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func(*args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak_memory
+
+
+def bench_parse(xml_files, workers):
+    elapsed, peak_memory = measure(parse_xml_files, xml_files, workers)
+    return {"time_s": elapsed, "files_per_s": len(xml_files) / elapsed, "peak_memory_mb": peak_memory / 2**20}
+
+
+def bench_json_write(xml_files, out_dir):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        records = parse_xml_files(xml_files)
+    json_file = os.path.join(out_dir, "write_coco_json.json")
+    elapsed, peak_memory = measure(write_coco_json, records, json_file)
+    return {"time_s": elapsed, "files_per_s": len(xml_files) / elapsed, "peak_memory_mb": peak_memory / 2**20,
+            "json_size_mb": os.path.getsize(json_file) / 2**20}
+
+
+def bench_script(script, call_type, xml_files, out_dir, workers):
+    module = load_script(script)
+    json_file = os.path.join(out_dir, os.path.splitext(os.path.basename(script))[0] + ".json")
+    if call_type == "convert":
+        func, args = module.convert, (xml_files, json_file, workers)
+    else:
+        train_size = int(len(xml_files) * 0.8)
+        splits = {json_file.replace(".json", "_train.json"): xml_files[:train_size],
+                  json_file.replace(".json", "_val.json"): xml_files[train_size:]}
+        func, args = module.convert_splits, (splits, workers)
+    elapsed, peak_memory = measure(func, *args)
+    return {"time_s": elapsed, "files_per_s": len(xml_files) / elapsed, "peak_memory_mb": peak_memory / 2**20}
+
+
+def bench_hdf5_xml_writer(frames, objects_per_frame, out_dir):
+    # convert_hdf5_to_voc.create_xml_file gets the boxes per class as [[xmin, ymin], [xmax, ymax]]
+    module = load_script("convert_hdf5_to_voc.py")
+    bb_data = [[[10, 20], [110, 220]] for _ in range(objects_per_frame // 2)]
+    xml_dir = os.path.join(out_dir, "hdf5_xmls")
+    os.makedirs(xml_dir, exist_ok=True)
+
+    def write_xml_files():
+        for frame_idx in range(frames):
+            module.create_xml_file("imgs", f"{frame_idx}.jpg", f"imgs/{frame_idx}.jpg", xml_dir, 1024, 768,
+                                   frame_idx, bb_data, bb_data)
+    elapsed, peak_memory = measure(write_xml_files)
+    return {"time_s": elapsed, "files_per_s": frames / elapsed, "peak_memory_mb": peak_memory / 2**20}
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline_file):
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nComparison with {baseline_file} (speedup = baseline time / current time)")
+    for name, result in results.items():
+        if "time_s" in result and "time_s" in baseline.get(name, {}):
+            speedup = baseline[name]["time_s"] / result["time_s"]
+            memory_ratio = result["peak_memory_mb"] / max(baseline[name]["peak_memory_mb"], 1e-9)
+            print(f"{name:<55} {speedup:6.2f}x time   {memory_ratio:6.2f}x peak memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the VOC to COCO conversion scripts on a synthetic dataset")
+    parser.add_argument("--frames", type=int, default=5000, help="Number of synthetic xml files")
+    parser.add_argument("--objects_per_frame", type=int, default=10, help="Average number of objects per frame")
+    parser.add_argument("--classes", type=str, nargs="+", default=list(DEFAULT_CLASSES), help="Class names")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to parse the xml files. Peak memory "
+                                                               "only accounts for the main process")
+    parser.add_argument("--xml_dir", type=str, default=None, help="Use these xml files instead of synthetic ones")
+    parser.add_argument("--scripts", type=str, nargs="+", default=list(CONVERSION_SCRIPTS),
+                        help="Conversion scripts to benchmark")
+    parser.add_argument("--out", type=str, default=None, help="Results json file (default: "
+                                                              "benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Results json file of a previous run")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_voc_to_coco_")
+    try:
+        if args.xml_dir is None:
+            xml_files = create_synthetic_voc_dir(os.path.join(work_dir, "xmls"), args.frames,
+                                                 args.objects_per_frame, args.classes)
+        else:
+            xml_files = sorted(glob.glob(os.path.join(args.xml_dir, "*.xml")))
+        out_dir = os.path.join(work_dir, "anns")
+        os.makedirs(out_dir)
+
+        results = {}
+        results["parse_xml_files"] = bench_parse(xml_files, args.workers)
+        results["write_coco_json"] = bench_json_write(xml_files, out_dir)
+        for script in args.scripts:
+            try:
+                results[script] = bench_script(script, CONVERSION_SCRIPTS[script], xml_files, out_dir, args.workers)
+            except ImportError as e:
+                results[script] = {"skipped": str(e)}
+        try:
+            results["convert_hdf5_to_voc.create_xml_file"] = bench_hdf5_xml_writer(len(xml_files),
+                                                                                   args.objects_per_frame, work_dir)
+        except ImportError as e:
+            results["convert_hdf5_to_voc.create_xml_file"] = {"skipped": str(e)}
+    finally:
+        shutil.rmtree(work_dir)
+
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<55} skipped ({result['skipped']})")
+        else:
+            print(f"{name:<55} {result['time_s']:8.3f} s  {result['files_per_s']:10.1f} files/s  "
+                  f"{result['peak_memory_mb']:8.1f} MB peak")
+
+    out_file = args.out
+    if out_file is None:
+        out_file = os.path.join(ROOT_DIR, "benchmarks", "results", time.strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_file)), exist_ok=True)
+    with open(out_file, "w") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "config": {"frames": len(xml_files), "objects_per_frame": args.objects_per_frame,
+                       "classes": args.classes, "workers": args.workers, "xml_dir": args.xml_dir},
+            "results": results,
+        }, f, indent=4)
+    print(f"Results saved to {out_file}")
+
+    if args.compare is not None:
+        print_comparison(results, args.compare)
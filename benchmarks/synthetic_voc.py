@@ -0,0 +1,78 @@
+import os
+import random
+import argparse
+import xml.etree.ElementTree as ET
+
+DEFAULT_CLASSES = ("vehicle", "pedestrian")
+FIRST_TIMESTAMP = 1604595240000000  # Frames are named after unix microseconds, as in the CARLA/Waymo datasets
+
+
+def create_synthetic_xml(xml_file, frame_name, objects, frame_width=1920, frame_height=1280):
+    # Same layout as the files written by convert_hdf5_to_voc.create_xml_file
+    annotation = ET.Element('annotation')
+    ET.SubElement(annotation, 'folder').text = "imgs"
+    ET.SubElement(annotation, 'filename').text = f'{frame_name}.jpg'
+    ET.SubElement(annotation, 'path').text = os.path.join("imgs", f'{frame_name}.jpg')
+    source = ET.SubElement(annotation, 'source')
+    ET.SubElement(source, 'database')
+    size = ET.SubElement(annotation, 'size')
+    ET.SubElement(size, 'width').text = str(frame_width)
+    ET.SubElement(size, 'height').text = str(frame_height)
+    ET.SubElement(size, 'depth').text = '3'
+    ET.SubElement(annotation, 'segmented')
+    for object_class, xmin, ymin, xmax, ymax in objects:
+        object_element = ET.SubElement(annotation, 'object')
+        ET.SubElement(object_element, "name").text = object_class
+        for tag in ("pose", "truncated", "difficult", "occluded"):
+            ET.SubElement(object_element, tag)
+        bndbox = ET.SubElement(object_element, "bndbox")
+        ET.SubElement(bndbox, "xmin").text = str(xmin)
+        ET.SubElement(bndbox, "xmax").text = str(xmax)
+        ET.SubElement(bndbox, "ymin").text = str(ymin)
+        ET.SubElement(bndbox, "ymax").text = str(ymax)
+    ET.ElementTree(annotation).write(xml_file)
+
+
+def create_synthetic_voc_dir(xml_dir, frames, objects_per_frame, classes=DEFAULT_CLASSES, seed=0,
+                             frame_width=1920, frame_height=1280):
+    """Create a directory of random VOC xml files.
+
+    Arguments:
+        xml_dir {str} -- Output directory.
+        frames {int} -- Number of xml files.
+        objects_per_frame {int} -- Average number of objects per frame (uniform between 0 and twice this value).
+        classes {tuple} -- Class names objects are drawn from.
+        seed {int} -- Random seed, the same arguments always create the same files.
+
+    Returns:
+        list -- Paths of the created xml files.
+    """
+    os.makedirs(xml_dir, exist_ok=True)
+    rng = random.Random(seed)
+    xml_files = []
+    for frame_idx in range(frames):
+        frame_name = FIRST_TIMESTAMP + frame_idx * 100000
+        objects = []
+        for _ in range(rng.randint(0, 2 * objects_per_frame)):
+            xmin = rng.randint(1, frame_width - 2)
+            ymin = rng.randint(1, frame_height - 2)
+            xmax = rng.randint(xmin + 1, min(frame_width, xmin + 400))
+            ymax = rng.randint(ymin + 1, min(frame_height, ymin + 400))
+            objects.append((rng.choice(classes), xmin, ymin, xmax, ymax))
+        xml_file = os.path.join(xml_dir, f'{frame_name}.xml')
+        create_synthetic_xml(xml_file, frame_name, objects, frame_width, frame_height)
+        xml_files.append(xml_file)
+    return xml_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a directory of synthetic VOC xml files")
+    parser.add_argument("xml_dir", type=str, help="Output directory")
+    parser.add_argument("--frames", type=int, default=10000, help="Number of xml files")
+    parser.add_argument("--objects_per_frame", type=int, default=10, help="Average number of objects per frame")
+    parser.add_argument("--classes", type=str, nargs="+", default=list(DEFAULT_CLASSES), help="Class names")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    create_synthetic_voc_dir(args.xml_dir, args.frames, args.objects_per_frame, args.classes, args.seed)
+    print(f"Created {args.frames} xml files in {args.xml_dir}")
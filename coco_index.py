@@ -0,0 +1,166 @@
+import json
+import numpy as np
+
+
+def get_id_array(ids):
+    # Ids of oversampled frames (timestamp + repeat idx) may not fit in int64, those fall back to Python ints
+    try:
+        return np.array(ids, dtype=np.int64)
+    except OverflowError:
+        return np.array(ids, dtype=object)
+
+
+class ImageView:
+    """One image of a CocoIndex, read from its columns on access."""
+    __slots__ = ("index", "row")
+
+    def __init__(self, index, row):
+        self.index = index
+        self.row = row
+
+    @property
+    def id(self):
+        return int(self.index.image_ids[self.row])
+
+    @property
+    def file_name(self):
+        return self.index.file_names[self.row]
+
+    @property
+    def width(self):
+        return int(self.index.widths[self.row])
+
+    @property
+    def height(self):
+        return int(self.index.heights[self.row])
+
+    @property
+    def annotation_rows(self):
+        return self.index.get_annotation_rows(self.row)
+
+
+class AnnotationView:
+    """One annotation of a CocoIndex, read from its columns on access."""
+    __slots__ = ("index", "row")
+
+    def __init__(self, index, row):
+        self.index = index
+        self.row = row
+
+    @property
+    def id(self):
+        return int(self.index.ann_ids[self.row])
+
+    @property
+    def image_row(self):
+        return int(self.index.ann_image_rows[self.row])
+
+    @property
+    def image_id(self):
+        return int(self.index.image_ids[self.index.ann_image_rows[self.row]])
+
+    @property
+    def category_id(self):
+        return int(self.index.ann_category_ids[self.row])
+
+    @property
+    def category_name(self):
+        return self.index.category_names[self.index.ann_category_rows[self.row]]
+
+    @property
+    def bbox(self):
+        return self.index.bboxes[self.row].tolist()
+
+
+class CocoIndex:
+    """Compact, array backed index of a COCO annotations file.
+
+    Images and annotations are kept as columns (one numpy array per field) instead of one dict per record, and rows
+    are their positions in the json lists. Annotations of each image are reachable in O(1) through CSR style offsets:
+    the annotation rows of image row i are ann_order[image_offsets[i]:image_offsets[i + 1]], in file order.
+
+    Usage:
+        coco_index = CocoIndex.from_json(json_file)
+        for image in coco_index.images():
+            for ann_row in image.annotation_rows:
+                ann = coco_index.annotation(ann_row)
+    """
+    def __init__(self, coco_data):
+        images = coco_data['images']
+        anns = coco_data['annotations']
+        categories = coco_data['categories']
+
+        self.image_ids = get_id_array([x['id'] for x in images])
+        self.file_names = [x['file_name'] for x in images]
+        self.widths = np.fromiter((x['width'] for x in images), dtype=np.int32, count=len(images))
+        self.heights = np.fromiter((x['height'] for x in images), dtype=np.int32, count=len(images))
+        # Times each image should be seen, set by balance_coco_anns --materialize none instead of adding copies
+        self.repeat_counts = np.fromiter((x.get('repeat_count', 1) for x in images), dtype=np.int64, count=len(images))
+        self.category_ids = np.array([x['id'] for x in categories], dtype=np.int64)
+        self.category_names = [x['name'] for x in categories]
+        self.image_rows = {image_id: row for row, image_id in enumerate(x['id'] for x in images)}
+        self.category_rows = {x['id']: row for row, x in enumerate(categories)}
+        self._ann_rows = None  # Built on the first get_annotation_row call
+
+        self.ann_ids = get_id_array([x['id'] for x in anns])
+        self.ann_image_rows = np.fromiter((self.image_rows[x['image_id']] for x in anns), dtype=np.intp,
+                                          count=len(anns))
+        self.ann_category_ids = np.fromiter((x['category_id'] for x in anns), dtype=np.int64, count=len(anns))
+        self.ann_category_rows = np.fromiter((self.category_rows[x['category_id']] for x in anns), dtype=np.intp,
+                                             count=len(anns))
+        # Integer boxes stay integers, so they are written back exactly as they were read. A single float box makes the
+        # whole column float, int_bboxes then says which values were ints in the file
+        self.bboxes = np.array([x['bbox'] for x in anns]).reshape(-1, 4) if anns else np.zeros((0, 4))
+        if self.bboxes.dtype.kind == 'f':
+            self.int_bboxes = np.array([[type(v) is int for v in x['bbox']] for x in anns], dtype=bool).reshape(-1, 4)
+        else:
+            self.int_bboxes = np.ones(self.bboxes.shape, dtype=bool)
+
+        self.ann_order = np.argsort(self.ann_image_rows, kind='stable')
+        self.image_offsets = np.zeros(len(images) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(self.ann_image_rows, minlength=len(images)), out=self.image_offsets[1:])
+
+    @classmethod
+    def from_json(cls, json_file):
+        with open(json_file, 'r') as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def get_image_row(self, image_id):
+        return self.image_rows[image_id]
+
+    def get_annotation_row(self, ann_id):
+        if self._ann_rows is None:
+            self._ann_rows = {ann_id: row for row, ann_id in enumerate(self.ann_ids.tolist())}
+        return self._ann_rows[ann_id]
+
+    def get_annotation_rows(self, image_rows):
+        """Annotation rows of one image row, or of an array of image rows (concatenated in that order)."""
+        if np.isscalar(image_rows):
+            return self.ann_order[self.image_offsets[image_rows]:self.image_offsets[image_rows + 1]]
+        image_rows = np.asarray(image_rows, dtype=np.intp)
+        starts = self.image_offsets[image_rows]
+        lengths = self.image_offsets[image_rows + 1] - starts
+        # Position of every wanted annotation inside ann_order, without a Python loop over the images
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.ann_order[positions]
+
+    def image(self, row):
+        return ImageView(self, row)
+
+    def annotation(self, row):
+        return AnnotationView(self, row)
+
+    def images(self):
+        return (ImageView(self, row) for row in range(len(self.file_names)))
+
+    def annotations(self):
+        return (AnnotationView(self, row) for row in range(len(self.ann_ids)))
+
+    def count_annotations_per_image(self):
+        """Return an images x categories matrix with the number of annotations of each category on each image."""
+        counts = np.zeros((len(self.file_names), len(self.category_names)), dtype=np.int64)
+        np.add.at(counts, (self.ann_image_rows, self.ann_category_rows), 1)
+        return counts
@@ -0,0 +1,182 @@
+import re
+import json
+from collections.abc import Iterator
+
+WRITE_BUFFER_SIZE = 1 << 20
+READ_BUFFER_SIZE = 1 << 20
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class CocoJsonWriter:
+    """Writes a COCO json file incrementally, so images/annotations never have to be held in memory at once.
+
+    Keys and list items are written in the order they are given, with the same separators as json.dumps, so the
+    output is byte for byte what json.dumps would produce for the equivalent dict.
+
+    Usage:
+        with CocoJsonWriter(json_file) as writer:
+            writer.begin_list("images")
+            writer.write_item(image)
+            writer.end_list()
+            writer.write_value("type", "instances")
+    """
+    def __init__(self, json_file):
+        self.json_fp = open(json_file, "w", buffering=WRITE_BUFFER_SIZE)
+        self.json_fp.write("{")
+        self.keys_written = 0
+        self.items_written = None  # Only set while a list is open
+
+    def _write_key(self, key):
+        if self.items_written is not None:
+            raise ValueError("List is still open, call end_list() before writing %s." % key)
+        if self.keys_written > 0:
+            self.json_fp.write(", ")
+        self.json_fp.write(json.dumps(key) + ": ")
+        self.keys_written += 1
+
+    def write_value(self, key, value):
+        self._write_key(key)
+        self.json_fp.write(json.dumps(value))
+
+    def begin_list(self, key):
+        self._write_key(key)
+        self.json_fp.write("[")
+        self.items_written = 0
+
+    def write_item(self, item):
+        if self.items_written > 0:
+            self.json_fp.write(", ")
+        self.json_fp.write(json.dumps(item))
+        self.items_written += 1
+
+    def write_items(self, items):
+        for item in items:
+            self.write_item(item)
+
+    def end_list(self):
+        self.json_fp.write("]")
+        self.items_written = None
+
+    def write_list(self, key, items):
+        self.begin_list(key)
+        self.write_items(items)
+        self.end_list()
+
+    def close(self):
+        self.json_fp.write("}")
+        self.json_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.json_fp.close()
+
+
+class CocoJsonReader:
+    """Reads a COCO json file incrementally, so images/annotations never have to be held in memory at once.
+
+    Iterating yields (key, value) for every top level key, in file order. List values (images, annotations, ...) are
+    given as iterators over their items, which have to be consumed before moving on to the next key (items left
+    unconsumed are skipped). Any other value is given as is.
+
+    Usage:
+        with CocoJsonReader(json_file) as reader:
+            for key, value in reader:
+                if key == "images":
+                    for image in value:
+                        ...
+    """
+    def __init__(self, json_file):
+        self.json_fp = open(json_file, "r")
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.json_fp.read(READ_BUFFER_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        # Next non whitespace character, without consuming it
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of %s." % self.json_fp.name)
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError("Expected one of %r at %s, found %r." % (chars, self.json_fp.name, char))
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number may continue on the next chunk, even when it is not at the end of the buffer (raw_decode
+                # gives 12 for a chunk ending in "12."), so it is only complete once a character that can not be part
+                # of it follows
+                if self.eof or (end < len(self.buffer) and not
+                                (isinstance(value, (int, float)) and self.buffer[end] in NUMBER_CHARS)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def _iter_list(self):
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(",]") == "]":
+                return
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                items = self._iter_list()
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, self._decode()
+            if self._expect(",}") == "}":
+                return
+
+    def close(self):
+        self.json_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def is_list_value(value):
+    """Whether a value given by CocoJsonReader is a list (an iterator over its items)."""
+    return isinstance(value, Iterator)
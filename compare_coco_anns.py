@@ -1,22 +1,122 @@
-import json
 import os
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+from coco_index import CocoIndex
+
+# Histogram edges of the number of annotations per image, and COCO small/medium/large area limits
+ANNS_PER_IMAGE_EDGES = [0, 1, 2, 6, 11, 21, 51]
+BBOX_AREA_EDGES = [0, 32 ** 2, 96 ** 2]
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def get_histogram(values, edges, weights):
+    # Counts of values in [edges[i], edges[i + 1]), the last bin is open ended
+    bins = np.searchsorted(edges, values, side='right') - 1
+    return np.bincount(bins, weights, minlength=len(edges)).astype(np.int64).tolist()
+
+
+def get_percentiles(values, weights):
+    values = np.repeat(values, weights)
+    if len(values) == 0:
+        return [None] * len(PERCENTILES)
+    return np.percentile(values, PERCENTILES).tolist()
+
 
+def compute_stats(json_file):
+    """Statistics of one COCO file, plus its image/annotation ids so files can be compared afterwards.
 
-def load_json_data(json_file):
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-    return data
+    Images with a repeat_count (balance_coco_anns --materialize none) are counted that many times, as are their
+    annotations, so metadata only oversampling shows up like oversampling with copies.
+    """
+    coco_index = CocoIndex.from_json(json_file)
+    image_weights = coco_index.repeat_counts
+    ann_weights = image_weights[coco_index.ann_image_rows]
+    anns_per_image = np.diff(coco_index.image_offsets)
+    widths = coco_index.bboxes[:, 2].astype(np.float64)
+    heights = coco_index.bboxes[:, 3].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aspects = widths / heights
+    finite_aspects = np.isfinite(aspects)
+    class_counts = np.bincount(coco_index.ann_category_rows, ann_weights, minlength=len(coco_index.category_names))
+    return {
+        "file": json_file,
+        "images": int(image_weights.sum()),
+        "annotations": int(ann_weights.sum()),
+        "repeated_images": int(image_weights.sum()) - len(coco_index),
+        "repeated_annotations": int(ann_weights.sum()) - len(coco_index.ann_ids),
+        "class_counts": dict(zip(coco_index.category_names, class_counts.astype(np.int64).tolist())),
+        "anns_per_image_histogram": get_histogram(anns_per_image, ANNS_PER_IMAGE_EDGES, image_weights),
+        "anns_per_image_mean": float(np.average(anns_per_image, weights=image_weights)) if len(anns_per_image) else 0.,
+        "anns_per_image_max": int(anns_per_image.max()) if len(anns_per_image) else 0,
+        "bbox_area_histogram": get_histogram(widths * heights, BBOX_AREA_EDGES, ann_weights),
+        "bbox_width_percentiles": get_percentiles(widths, ann_weights),
+        "bbox_height_percentiles": get_percentiles(heights, ann_weights),
+        "bbox_aspect_percentiles": get_percentiles(aspects[finite_aspects], ann_weights[finite_aspects]),
+        "image_ids": coco_index.image_ids,
+        "ann_ids": coco_index.ann_ids,
+    }
+
+
+def format_values(values):
+    return " ".join("-" if x is None else f"{x:.1f}" for x in values)
+
+
+def print_stats(stats):
+    print(f"\n{stats['file']}")
+    print(f"  images {stats['images']}, annotations {stats['annotations']}" +
+          (f" (of which {stats['repeated_images']} images and {stats['repeated_annotations']} annotations are repeats)"
+           if stats['repeated_images'] else ""))
+    print("  class counts: " + ", ".join(f"{name} {count}" for name, count in stats['class_counts'].items()))
+    edges = ANNS_PER_IMAGE_EDGES
+    bins = [f"{edges[i]}-{edges[i + 1] - 1}" if edges[i + 1] - 1 > edges[i] else str(edges[i]) for i in range(len(edges) - 1)]
+    bins.append(f"{edges[-1]}+")
+    print("  annotations per image: " + ", ".join(f"[{b}] {c}" for b, c in zip(bins, stats['anns_per_image_histogram'])) +
+          f" (mean {stats['anns_per_image_mean']:.2f}, max {stats['anns_per_image_max']})")
+    small, medium, large = stats['bbox_area_histogram']
+    print(f"  bbox areas: small {small}, medium {medium}, large {large}")
+    print(f"  bbox percentiles {PERCENTILES}: width {format_values(stats['bbox_width_percentiles'])} | "
+          f"height {format_values(stats['bbox_height_percentiles'])} | "
+          f"aspect (w/h) {format_values(stats['bbox_aspect_percentiles'])}")
+
+
+def print_differences(reference, stats):
+    # Images/annotations are matched by id, repeats (repeat_count) are reported on their own
+    added_images = len(np.setdiff1d(stats['image_ids'], reference['image_ids']))
+    removed_images = len(np.setdiff1d(reference['image_ids'], stats['image_ids']))
+    added_anns = len(np.setdiff1d(stats['ann_ids'], reference['ann_ids']))
+    removed_anns = len(np.setdiff1d(reference['ann_ids'], stats['ann_ids']))
+    repeated_images = stats['repeated_images'] - reference['repeated_images']
+    repeated_anns = stats['repeated_annotations'] - reference['repeated_annotations']
+    print(f"\n{stats['file']} vs {reference['file']}")
+    print(f"  images: +{added_images} -{removed_images}, annotations: +{added_anns} -{removed_anns}" +
+          (f", repeats: images {repeated_images:+d}, annotations {repeated_anns:+d}"
+           if repeated_images or repeated_anns else ""))
+    names = list(dict.fromkeys(list(reference['class_counts']) + list(stats['class_counts'])))
+    print("  class counts: " + ", ".join(f"{name} {stats['class_counts'].get(name, 0) - reference['class_counts'].get(name, 0):+d}"
+                                          for name in names))
 
 
 if __name__ == "__main__":
-    splits = ['train']
-    for split in splits:
-        coco_anns = [f"/home/alan/workspace/Mestrado/dataset/WAYMO_skip10/anns_coco/{split}.json", \
-                     f"/home/alan/workspace/Mestrado/dataset/WAYMO_skip10/anns_coco/balanced_anns/{split}_oversampled.json", \
-                     f"/home/alan/workspace/Mestrado/dataset/WAYMO_skip10/anns_coco/balanced_anns/{split}_undersampled.json"]
-        data = [load_json_data(x) for x in coco_anns]
-
-        print('split', split)
-        for x in zip(coco_anns, data):
-            print("annotations, images")
-            print(x[0], len(x[1]['annotations']), len(x[1]['images']))
+    parser = argparse.ArgumentParser(description="Print statistics of COCO files and how they differ from the first one "
+                                                 "(e.g. original, oversampled and undersampled splits)")
+    parser.add_argument("anns", type=str, nargs="+", help="coco annotations files, the first one is the reference for"
+                                                          " the differences")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes used to load the files")
+    parser.add_argument("--out", type=str, default=None, help="json file to save the statistics to")
+    args = parser.parse_args()
+
+    with Pool(max(1, min(args.workers, len(args.anns)))) as pool:
+        all_stats = pool.map(compute_stats, args.anns)
+
+    for stats in all_stats:
+        print_stats(stats)
+    for stats in all_stats[1:]:
+        print_differences(all_stats[0], stats)
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump([{k: v for k, v in stats.items() if k not in ("image_ids", "ann_ids")} for stats in all_stats], f,
+                      indent=4)
@@ -1,32 +1,42 @@
-import json
 import os
+import numpy as np
 
+from coco_index import CocoIndex
+from label_files import write_labels
 
-def convert_coco_bb_to_mAP(json_coco_file, out_dir):
-    with open(json_coco_file, 'r') as f:
-        coco_data = json.load(f)
 
-    # Creates empty txt files for frames without anns
-    for img in coco_data['images']:
-        with open(os.path.join(out_dir, str(img['id']) + '.txt'), 'w') as f:
-            pass
+def get_mAP_labels(coco_index):
+    # One (frame_name, text) pair per image, frames without anns get an empty file
+    bboxes = coco_index.bboxes.copy()
+    bboxes[:, 2:] += bboxes[:, :2]  # [xmin, ymin, width, height] -> [xmin, ymin, xmax, ymax]
+    bboxes = bboxes.tolist()
+    if coco_index.bboxes.dtype.kind == 'f':
+        # Files mixing int and float boxes: values that were ints (xmax/ymax if both of their terms were) stay ints
+        int_corners = coco_index.int_bboxes.copy()
+        int_corners[:, 2:] &= int_corners[:, :2]
+        for row in np.flatnonzero(int_corners.any(axis=1)).tolist():
+            bboxes[row] = [int(x) if is_int else x for x, is_int in zip(bboxes[row], int_corners[row].tolist())]
+    category_names = [coco_index.category_names[row] for row in coco_index.ann_category_rows.tolist()]
+    for image in coco_index.images():
+        lines = []
+        for ann_row in image.annotation_rows.tolist():
+            xmin, ymin, xmax, ymax = bboxes[ann_row]
+            lines.append(f"{category_names[ann_row]} {xmin} {ymin} {xmax} {ymax}\n")
+        yield str(image.id), "".join(lines)
 
-    # Creates ann txt files
-    categories = {x['id']: x['name'] for x in coco_data['categories']}
-    ann_len = len(coco_data['annotations'])
-    for ann_idx, ann in enumerate(coco_data['annotations']):
-        print(f'{ann_idx}/{ann_len}')
-        with open(os.path.join(out_dir, str(ann['image_id']) + '.txt'), 'a') as f:
-            f.write(categories[ann['category_id']])
-            xmin, ymin, width, height = ann['bbox']
-            xmax = xmin + width
-            ymax = ymin + height
-            bbox = [xmin, ymin, xmax, ymax]
-            [f.write(" " + str(x)) for x in bbox]
-            f.write('\n')
+
+def convert_coco_bb_to_mAP(json_coco_file, out_dir, workers=1, packed_file=None):
+    coco_index = CocoIndex.from_json(json_coco_file)
+
+    # Boxes are grouped per image, so each txt file is written exactly once (or, with packed_file, all of them go into
+    # one store that label_files.py can expand back to txt files)
+    frames_written = write_labels(get_mAP_labels(coco_index), out_dir, workers, packed_file)
+    print(f'{frames_written} frame labels written to {out_dir if packed_file is None else packed_file}')
 
 
 if __name__ == "__main__":
     json_coco_file = "/home/alan/workspace/Mestrado/dataset/CARLA_1920x1280_skip10_WAYMO_skip10/anns_coco/test.json"
     out_dir = "/home/alan/workspace/Mestrado/dataset/CARLA_1920x1280_skip10_WAYMO_skip10/anns_mAP"
-    convert_coco_bb_to_mAP(json_coco_file, out_dir)
+    workers = os.cpu_count()  # Threads used to write the txt files
+    packed_file = None  # e.g. out_dir + ".labels" to write one packed store instead of one txt file per image
+    convert_coco_bb_to_mAP(json_coco_file, out_dir, workers, packed_file)
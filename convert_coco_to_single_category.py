@@ -1,44 +1,86 @@
 import os
 import argparse
 import json
-from shutil import copyfile
+import tempfile
 
+from coco_stream import CocoJsonReader, CocoJsonWriter, is_list_value
 
-def filter_annotations(args, coco_data):
-    new_categories = [{"supercategory": "none", "id": 1, "name": args.category}]
-    new_anns = []
-    old_category_id = [x['id'] for x in coco_data['categories'] if x['name'] == args.category]
-    old_category_id = old_category_id[0]
-    for ann_idx, ann in enumerate(coco_data['annotations']):
-        if ann['category_id'] == old_category_id:
-            ann['category_id'] = 1  # Single class will always have this ID
-            new_anns.append(ann)
-    return new_anns, new_categories
 
+def parse_category_map(entries):
+    """Turn ["vehicle=car,van,truck", "pedestrian"] into {"car": "vehicle", "van": "vehicle", "truck": "vehicle",
+    "pedestrian": "pedestrian"}. A plain name keeps that category as it is."""
+    category_map = {}
+    for entry in entries:
+        new_name, _, old_names = entry.rpartition('=')
+        for old_name in old_names.split(','):
+            category_map[old_name] = new_name or old_name
+    return category_map
 
-def create_new_json(args):
-    # Data preprocessing
-    with open(args.anns, 'r') as f:
-        coco_data = json.load(f)
-    copyfile(args.anns, args.out)
 
-    new_anns, new_categories = filter_annotations(args, coco_data)
+def get_new_categories(categories, category_map):
+    # New categories are numbered from 1 in the order they are first mapped to
+    categories = list(categories)
+    new_categories = {}
+    for new_name in category_map.values():
+        if new_name not in new_categories:
+            new_categories[new_name] = {"supercategory": "none", "id": len(new_categories) + 1, "name": new_name}
+    category_id_map = {x['id']: new_categories[category_map[x['name']]]['id'] for x in categories
+                       if x['name'] in category_map}
+    missing = set(category_map) - {x['name'] for x in categories}
+    if missing:
+        print(f"Warning: categories {sorted(missing)} are not on the annotations file")
+    return list(new_categories.values()), category_id_map
 
-    # Write on new json the data
-    with open(args.out, 'r') as f:
-        new_coco_data = json.load(f)
-    new_coco_data['annotations'] = new_anns
-    new_coco_data['categories'] = new_categories
-    with open(args.out, 'w') as f:
-        json.dump(new_coco_data, f)
+
+def filter_annotations(anns, category_id_map):
+    for ann in anns:
+        if ann['category_id'] in category_id_map:
+            ann['category_id'] = category_id_map[ann['category_id']]
+            yield ann
+
+
+def create_new_json(anns_json, out_json, category_map):
+    """Keep (and rename/merge) some categories of a COCO file, in one streaming pass.
+
+    Annotations of categories not in category_map are dropped, images are all kept. If the categories come after the
+    annotations in the file (as in the files written by these tools), annotations are spooled to a temporary file
+    until they are known, so memory does not grow with the dataset.
+
+    Arguments:
+        anns_json {str} -- Input COCO json file.
+        out_json {str} -- Output COCO json file.
+        category_map {dict} -- Category name to keep to its new name, see parse_category_map.
+    """
+    category_id_map = None
+    with CocoJsonReader(anns_json) as reader, CocoJsonWriter(out_json) as writer, \
+            tempfile.TemporaryFile("w+", dir=os.path.dirname(os.path.abspath(out_json))) as anns_spool:
+        spooled = False
+        for key, value in reader:
+            if key == 'annotations' and category_id_map is None:
+                for ann in value:
+                    anns_spool.write(json.dumps(ann) + "\n")
+                spooled = True
+            elif key == 'annotations':
+                writer.write_list(key, filter_annotations(value, category_id_map))
+            elif key == 'categories':
+                new_categories, category_id_map = get_new_categories(value, category_map)
+                if spooled:
+                    anns_spool.seek(0)
+                    writer.write_list('annotations', filter_annotations(map(json.loads, anns_spool), category_id_map))
+                writer.write_list(key, new_categories)
+            elif is_list_value(value):
+                writer.write_list(key, value)
+            else:
+                writer.write_value(key, value)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Choose annotation category to be kept from the coco file')
+    parser = argparse.ArgumentParser(description='Choose annotation categories to be kept (or merged) from the coco file')
     parser.add_argument("anns", type=str, help='coco annotations file', default="waymo_skip10_train.json")
-    parser.add_argument("category", type=str, help="name of category to keep", default="pedestrian")
+    parser.add_argument("category", type=str, nargs="+", help="name of category to keep, or new_name=old_name1,old_name2 "
+                                                              "to merge categories into a new one (e.g. vehicle=car,van,truck)",
+                        default="pedestrian")
     parser.add_argument("out", type=str, help="name of new coco annotations file to be created", default="waymo_skip10_train_vehicles.json")
     args = parser.parse_args()
 
-    create_new_json(args)
-
+    create_new_json(args.anns, args.out, parse_category_map(args.category))
@@ -1,18 +1,35 @@
 import os
 import json
+import numpy as np
+
+from coco_index import CocoIndex
+from label_files import write_labels
 
 def read_json(json_file):
     with open(json_file, 'r') as f:
         json_data = json.load(f)
     return json_data
 
-def normalize_yolo_bbox(yolo_bbox, images_size):
-    img_width, img_height = images_size
-    yolo_bbox[1] /= img_width
-    yolo_bbox[2] /= img_height
-    yolo_bbox[3] /= img_width
-    yolo_bbox[4] /= img_height
-    return yolo_bbox
+def get_yolo_bboxes(coco_index):
+    """Convert every annotation of the index to YOLO at once.
+
+    Returns:
+        tuple -- (object_classes, yolo_bboxes): 0 indexed class of each annotation, and its box as
+                 [xcenter, ycenter, width, height] normalized by the size of the annotation's image.
+    """
+    bboxes = coco_index.bboxes.astype(np.float64)
+    # For some reason there are negative entries (e.g. -1)... I am rounding them to zero
+    np.maximum(bboxes[:, :2], 0, out=bboxes[:, :2])
+    img_widths = coco_index.widths[coco_index.ann_image_rows]
+    img_heights = coco_index.heights[coco_index.ann_image_rows]
+    yolo_bboxes = np.empty_like(bboxes)
+    yolo_bboxes[:, 0] = (bboxes[:, 0] + bboxes[:, 2]/2) / img_widths
+    yolo_bboxes[:, 1] = (bboxes[:, 1] + bboxes[:, 3]/2) / img_heights
+    yolo_bboxes[:, 2] = bboxes[:, 2] / img_widths
+    yolo_bboxes[:, 3] = bboxes[:, 3] / img_heights
+    # YOLO from pytorch wants 0 indexed classes, and COCO is 1 indexed (ids may also have gaps)
+    object_classes = np.searchsorted(np.sort(coco_index.category_ids), coco_index.ann_category_ids)
+    return object_classes, yolo_bboxes
 
 def create_empty_annotation_files(json_data, output_dir):
     for img in json_data['images']:
@@ -21,36 +38,35 @@ def create_empty_annotation_files(json_data, output_dir):
     return
 
 
-def create_annotations_yolo(json_file, output_dir, images_size):
-    json_data = read_json(json_file)
-    os.makedirs(output_dir, exist_ok=False)
+def get_yolo_labels(coco_index):
+    # One (frame_name, text) pair per image with annotations, with all of its lines
+    object_classes, yolo_bboxes = get_yolo_bboxes(coco_index)
+    object_classes = object_classes.tolist()
+    yolo_bboxes = yolo_bboxes.tolist()
+    for image in coco_index.images():
+        ann_rows = image.annotation_rows.tolist()
+        if len(ann_rows) == 0:
+            continue
+        lines = []
+        for ann_row in ann_rows:
+            bb_x_center, bb_y_center, bb_width, bb_height = yolo_bboxes[ann_row]
+            lines.append(f"{object_classes[ann_row]} {bb_x_center} {bb_y_center} {bb_width} {bb_height} \n")
+        yield str(image.id), "".join(lines)
+
+
+def create_annotations_yolo(json_file, output_dir, workers=1, packed_file=None):
+    coco_index = CocoIndex(read_json(json_file))
+    if packed_file is None:
+        os.makedirs(output_dir, exist_ok=False)
 
     # This is done so that every image has at least one corresponding txt file
     #create_empty_annotation_files(json_data, output_dir)
 
     # object_classes = json_data['categories']  # 1 = vehicle; 2 = pedestrian
-    for idx, annotation in enumerate(json_data['annotations']):
-        print('Working on annotation {}/{}'.format(idx, len(json_data['annotations'])))
-        yolo_annotation_file_name = str(annotation['image_id']) + '.txt'
-        coco_bbox = annotation['bbox']
-        # For some reason there are negative entries (e.g. -1)... I am rounding them to zero
-        if coco_bbox[0] < 0:
-            coco_bbox[0] = 0
-        if coco_bbox[1] < 0:
-            coco_bbox[1] = 0
-
-        # Yolo bbox will be a normalized one, with the coordinates being: [obj_class, xcenter, ycenter, width, height]
-        object_class = annotation['category_id'] - 1  # YOLO from pytorch wants 0 indexed classes, and COCO is 1 indexed 
-        bb_width = coco_bbox[2]
-        bb_height = coco_bbox[3]
-        bb_x_center = coco_bbox[0] + bb_width/2
-        bb_y_center = coco_bbox[1] + bb_height/2
-        yolo_bbox = [object_class, bb_x_center, bb_y_center, bb_width, bb_height]
-        yolo_bbox = normalize_yolo_bbox(yolo_bbox, images_size)
-        # Create a txt file with the data (or append to an already created txt, since many objects exist in the same image)
-        with open(os.path.join(output_dir, yolo_annotation_file_name), 'a') as f:
-            [f.write(str(x) + " ") for x in yolo_bbox]
-            f.write('\n')
+    # Boxes are normalized by the size of their own image, then grouped per image so each txt file is written at once
+    # With packed_file, all labels go into one store instead (see label_files.py to expand it back to txt files)
+    frames_written = write_labels(get_yolo_labels(coco_index), output_dir, workers, packed_file)
+    print(f'{frames_written} frame labels written to {output_dir if packed_file is None else packed_file}')
 
 
 if __name__ == "__main__":
@@ -59,11 +75,12 @@ if __name__ == "__main__":
     coco_test_json = "/home/aiss-v100/workspace/alan/dataset/coco/test_fold_1.json"
     yolo_train_dir = "/home/aiss-v100/workspace/alan/dataset/YOLO_format/kfold_1/train"
     yolo_test_dir = "/home/aiss-v100/workspace/alan/dataset/YOLO_format/kfold_1/test"
-    images_size = (1024, 768)
+    workers = os.cpu_count()  # Threads used to write the label files
+    packed = False  # Write each split into one <dir>.labels store instead of one txt file per image
 
     # Process annotations
     print('Working on training anns...')
-    create_annotations_yolo(coco_train_json, yolo_train_dir, images_size)
+    create_annotations_yolo(coco_train_json, yolo_train_dir, workers, yolo_train_dir + '.labels' if packed else None)
     print('Working on validation anns...')
-    create_annotations_yolo(coco_test_json, yolo_test_dir, images_size)
+    create_annotations_yolo(coco_test_json, yolo_test_dir, workers, yolo_test_dir + '.labels' if packed else None)
 
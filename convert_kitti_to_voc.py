@@ -1,9 +1,10 @@
 import numpy as np
 import sys
-import cv2
 import os
 import xml.etree.ElementTree as ET
 
+from image_size import ImageSizeCache
+
 
 def get_bb_data(ann_file):
     bb_vehicles, bb_walkers = [], []
@@ -82,18 +83,16 @@ def create_xml_file(frame_name, img_path, bbs_out_dir, frame_width, frame_height
 
 def create_voc_anns(bbs_kitti, imgs_dir, bbs_out_dir):
     ann_files = [os.path.join(bbs_kitti, x) for x in os.listdir(bbs_kitti) if x.endswith(".txt")]
-    img_files = [os.path.join(imgs_dir, x) for x in os.listdir(imgs_dir) if x.endswith(".jpg")]
-
-    tmp_img = cv2.imread(img_files[0])
-    frame_width = tmp_img.shape[1]
-    frame_height = tmp_img.shape[0]
+    # KITTI images do not all have the same size, so each one is read from its header
+    image_sizes = ImageSizeCache(imgs_dir)
     for frame_idx, frame_ann_file in enumerate(ann_files):
         sys.stdout.write("\r")
         sys.stdout.write('Saving frame {0}/{1}'.format(frame_idx+1, len(ann_files)))
         sys.stdout.flush()
         bb_vehicles, bb_walkers = get_bb_data(frame_ann_file)
-        img_path = img_files[frame_idx]
         frame_name = os.path.basename(frame_ann_file).replace(".txt", "")
+        img_path = os.path.join(imgs_dir, frame_name + ".jpg")
+        frame_width, frame_height = image_sizes.get_size(frame_name + ".jpg")
         create_xml_file(frame_name, img_path, bbs_out_dir, frame_width, frame_height, bb_vehicles, bb_walkers)
     print('\nDone.')
 
@@ -1,7 +1,8 @@
 import sys
 import os
 import xml.etree.ElementTree as ET
-import cv2
+
+from image_size import ImageSizeCache
 
 
 def create_xml_file(imgs_input_dir, bb_output_dir, img_name, img_path, frame_width, frame_height, xml_filename, bb_vehicles, bb_pedestrians):
@@ -69,6 +70,8 @@ if __name__ == "__main__":
     os.makedirs(bb_output_dir, exist_ok=True)
     bb_input_files = os.listdir(bb_input_dir)
     bb_input_files_path = [os.path.join(bb_input_dir, x) for x in bb_input_files]
+    # Image sizes are read from the jpg headers, and kept on disk so that re-runs do not even open the images
+    image_sizes = ImageSizeCache(imgs_input_dir, os.path.join(os.path.dirname(bb_output_dir), "image_sizes.json"))
 
     # Creating one XML at a time
     for bb_file_idx in range(len(bb_input_files)):
@@ -92,9 +95,7 @@ if __name__ == "__main__":
             xml_filename = frame_name + ".xml"
             img_path = os.path.join(os.path.join(imgs_input_dir, img_name))
             # Img dimensions
-            img = cv2.imread(img_path)
-            frame_width = img.shape[1]
-            frame_height = img.shape[0]
+            frame_width, frame_height = image_sizes.get_size(img_name)
             # Finally create the xml files
             create_xml_file(imgs_input_dir, bb_output_dir, img_name, img_path, frame_width, frame_height, xml_filename, bb_vehicles, bb_pedestrians)
-
+    image_sizes.save()
@@ -1,24 +1,62 @@
-import json
-import copy
+import os
 
+from coco_stream import CocoJsonReader, CocoJsonWriter, is_list_value
 
-def create_subset_json(full_json, subset_json, out_json):
-    # IO
-    with open(full_json, 'r') as f:
-        data_full = json.load(f)
-    with open(subset_json, 'r') as f:
-        data_subset = json.load(f)
+# Image fields two COCO files can be joined on
+JOIN_KEYS = {
+    "file_name": lambda image: image['file_name'],
+    "id": lambda image: image['id'],
+    "basename": lambda image: os.path.splitext(os.path.basename(image['file_name']))[0],  # No dirs nor extension
+}
 
+
+def read_join_keys(json_file, key):
+    join_key = JOIN_KEYS[key]
+    with CocoJsonReader(json_file) as reader:
+        for section, value in reader:
+            if section == 'images':
+                return {join_key(image) for image in value}
+    raise ValueError("No images found in %s." % json_file)
+
+
+def create_subset_json(full_json, subset_json, out_json, key="file_name"):
+    """Write the images of full_json that are also in subset_json (joined on key), and their annotations.
+
+    Both files are streamed, only the join keys of subset_json and the ids of the kept images are held in memory.
+    Images have to come before annotations in full_json, as in every file written by these tools.
+
+    Arguments:
+        full_json {str} -- COCO json file the images/annotations are taken from.
+        subset_json {str} -- COCO json file with the images to keep.
+        out_json {str} -- Output COCO json file.
+        key {str} -- Image field the files are joined on: "file_name", "id" or "basename" (file name without
+                     directories and extension).
+    """
     # Seeing which files are from waymo, and not carla
-    out_data = copy.deepcopy(data_full)
-    waymo_file_names = [x['file_name'] for x in data_subset['images']]
-    out_data['images'] = [x for x in out_data['images'] if x['file_name'] in waymo_file_names]
-    out_data['annotations'] = [x for x in out_data['annotations'] if
-                                            str(x['image_id']) + ".jpg" in waymo_file_names]
+    subset_keys = read_join_keys(subset_json, key)
+    join_key = JOIN_KEYS[key]
 
     # Writing a new JSON with only waymo_skip10 annotations
-    with open(out_json, 'w') as f:
-        json.dump(out_data, f)
+    kept_image_ids = None
+    with CocoJsonReader(full_json) as reader, CocoJsonWriter(out_json) as writer:
+        for section, value in reader:
+            if section == 'images':
+                kept_image_ids = set()
+                writer.begin_list(section)
+                for image in value:
+                    if join_key(image) in subset_keys:
+                        kept_image_ids.add(image['id'])
+                        writer.write_item(image)
+                writer.end_list()
+            elif section == 'annotations':
+                if kept_image_ids is None:
+                    raise ValueError("Annotations come before images in %s." % full_json)
+                writer.write_list(section, (ann for ann in value if ann['image_id'] in kept_image_ids))
+            elif is_list_value(value):
+                writer.write_list(section, value)
+            else:
+                writer.write_value(section, value)
+    print(f"{len(kept_image_ids)} images kept in {out_json}")
 
 
 if __name__ == "__main__":
@@ -26,4 +64,5 @@ if __name__ == "__main__":
     mixed_json = f"/home/alan/workspace/Mestrado/dataset/CARLA_1920x1280_skip10_WAYMO_skip10/anns_coco/{split}.json"
     waymo_skip10_json = f"/home/alan/workspace/Mestrado/dataset/WAYMO_skip10/anns_coco/{split}.json"
     out_json = f"/home/alan/workspace/Mestrado/dataset/CARLA_1920x1280_skip10_WAYMO_skip10/anns_coco/{split}_waymo_subset.json"
-    create_subset_json(mixed_json, waymo_skip10_json, out_json)
+    key = "file_name"  # Image field both files are joined on: "file_name", "id" or "basename"
+    create_subset_json(mixed_json, waymo_skip10_json, out_json, key)
@@ -1,37 +1,141 @@
 import json
 import os
 import argparse
+import tempfile
 
+from coco_stream import CocoJsonReader, CocoJsonWriter, is_list_value
 
-def load_coco_data(json_file):
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-    return data
 
+class IdRemapper:
+    """Gives every id of the merged file a unique value: ids are kept unless already taken, else a new one is given.
 
-def create_new_json(carla_data, waymo_data, split, out_dir):
-    carla_data['images'] += waymo_data['images']
-    start_ann_id = len(carla_data['annotations'])
-    for ann_idx, ann in enumerate(waymo_data['annotations']):
-        ann['id'] = start_ann_id + ann_idx
-        carla_data['annotations'].append(ann)
-    with open(os.path.join(out_dir, split + ".json"), 'w') as f:
-        json.dump(carla_data, f)
+    New ids start above every id of the inputs (all_ids), so a remapped id can never take the id of a later record and
+    only the ids that really conflict change (image ids are frame timestamps, which label files are named after).
+    """
+    def __init__(self, all_ids=(), on_conflict="remap"):
+        self.on_conflict = on_conflict
+        self.used_ids = set()
+        self.next_id = max((x for x in all_ids if isinstance(x, int)), default=0) + 1
+        self.remapped = 0
+
+    def get_new_id(self, old_id, description=None):
+        new_id = old_id
+        if old_id in self.used_ids:
+            if self.on_conflict == "error":
+                raise ValueError("%s is already used by a previous file." % description)
+            new_id = self.next_id
+            self.next_id += 1
+            self.remapped += 1
+        self.used_ids.add(new_id)
+        return new_id
+
+
+def read_ids(json_files):
+    # First pass over the inputs, only the ids of their images, annotations and categories are kept
+    ids = {"images": set(), "annotations": set(), "categories": set()}
+    for json_file in json_files:
+        with CocoJsonReader(json_file) as reader:
+            for key, value in reader:
+                if key in ids:
+                    ids[key].update(x['id'] for x in value)
+    return ids
+
+
+def merge_coco_files(json_files, out_json, on_conflict="remap"):
+    """Merge any number of COCO json files into one, giving images, annotations and categories unique ids.
+
+    Categories are merged by name. Ids are kept as they are unless a previous file already used them, in which case
+    they are either remapped to an id above all the input ids or reported as an error (on_conflict). Inputs are read
+    once for their ids, then streamed: images are written right away and annotations are spooled to temporary files
+    until their file's categories are known, so memory only grows with the id maps.
+
+    Arguments:
+        json_files {list} -- Input COCO json files.
+        out_json {str} -- Output COCO json file.
+        on_conflict {str} -- "remap" to give conflicting ids a new value, "error" to raise a ValueError instead.
+    """
+    all_ids = read_ids(json_files)
+    image_ids = IdRemapper(all_ids["images"], on_conflict)
+    ann_ids = IdRemapper(all_ids["annotations"], on_conflict)
+    category_ids = IdRemapper(all_ids["categories"], "remap")  # Same name means same category, so different names can always be remapped
+    categories = {}  # name: merged category
+    image_id_maps = []  # Per input file, old image id: new image id
+    category_id_maps = []  # Per input file, old category id: new category id
+    ann_spools = []
+    other_values = {}  # Other top level keys (type, info, licenses...) as found on the first file that has them
+
+    out_dir = os.path.dirname(os.path.abspath(out_json))
+    with CocoJsonWriter(out_json) as writer:
+        writer.begin_list("images")
+        for json_file in json_files:
+            image_id_map = {}
+            category_id_map = {}
+            ann_spool = tempfile.TemporaryFile("w+", dir=out_dir)
+            with CocoJsonReader(json_file) as reader:
+                for key, value in reader:
+                    if key == "images":
+                        for image in value:
+                            if image['id'] in image_id_map:
+                                raise ValueError("Image id %s is repeated in %s." % (image['id'], json_file))
+                            new_id = image_ids.get_new_id(image['id'], "Image id %s of %s" % (image['id'], json_file))
+                            image_id_map[image['id']] = new_id
+                            image['id'] = new_id
+                            writer.write_item(image)
+                    elif key == "annotations":
+                        for ann in value:
+                            ann_spool.write(json.dumps(ann) + "\n")
+                    elif key == "categories":
+                        for category in value:
+                            if category['name'] not in categories:
+                                new_category = dict(category)
+                                new_category['id'] = category_ids.get_new_id(category['id'])
+                                categories[category['name']] = new_category
+                            category_id_map[category['id']] = categories[category['name']]['id']
+                    elif key not in other_values:
+                        other_values[key] = list(value) if is_list_value(value) else value
+            image_id_maps.append(image_id_map)
+            category_id_maps.append(category_id_map)
+            ann_spools.append(ann_spool)
+            print(f"Read {json_file}")
+        writer.end_list()
+
+        for key, value in other_values.items():
+            writer.write_value(key, value)
+
+        writer.begin_list("annotations")
+        for json_file, image_id_map, category_id_map, ann_spool in zip(json_files, image_id_maps, category_id_maps,
+                                                                      ann_spools):
+            ann_spool.seek(0)
+            for line in ann_spool:
+                ann = json.loads(line)
+                ann['id'] = ann_ids.get_new_id(ann['id'], "Annotation id %s of %s" % (ann['id'], json_file))
+                ann['image_id'] = image_id_map[ann['image_id']]
+                ann['category_id'] = category_id_map[ann['category_id']]
+                writer.write_item(ann)
+            ann_spool.close()
+        writer.end_list()
+
+        writer.write_list("categories", categories.values())
+    print(f"Remapped {image_ids.remapped} image ids, {ann_ids.remapped} annotation ids and "
+          f"{category_ids.remapped} category ids")
+
+
+def create_new_json(json_files, split, out_dir, on_conflict="remap"):
+    merge_coco_files(json_files, os.path.join(out_dir, split + ".json"), on_conflict)
     print(f"Created {split}.json file")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Creates a new mixed dataset (train and val) based on data from"
-                                                 " two json files")
-    parser.add_argument("carla_json_dir", type=str, help="Dir containing train and val COCO JSON files for carla")
-    parser.add_argument("waymo_json_dir", type=str, help="Dir containing train and val COCO JSON files for waymo")
+                                                 " any number of json files")
+    parser.add_argument("json_dirs", type=str, nargs="+", help="Dirs containing train and val COCO JSON files for each "
+                                                              "dataset (e.g. carla and waymo)")
     parser.add_argument("out_dir", type=str, help="Dir to store new json files")
+    parser.add_argument("--on_conflict", type=str, choices=["remap", "error"], default="remap",
+                        help="what to do with image/annotation ids already used by a previous dataset")
     args = parser.parse_args()
     splits = ['train', 'val']
 
     for split in splits:
-        carla_json = os.path.join(args.carla_json_dir, split + ".json")
-        waymo_json = os.path.join(args.waymo_json_dir, split + ".json")
-        carla_data = load_coco_data(carla_json)
-        waymo_data = load_coco_data(waymo_json)
-        create_new_json(carla_data, waymo_data, split, args.out_dir)
+        json_files = [os.path.join(json_dir, split + ".json") for json_dir in args.json_dirs]
+        create_new_json(json_files, split, args.out_dir, args.on_conflict)
@@ -0,0 +1,91 @@
+import os
+import json
+import struct
+
+# Start of frame markers that carry the image size (SOF0-SOF15, except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("%s is truncated." % f.name)
+    return data
+
+
+def get_jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":  # Markers may be preceded by any number of fill bytes
+            byte = f.read(1)
+        if not byte:
+            raise ValueError("No start of frame marker found in %s." % f.name)
+        marker = byte[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        segment_length = struct.unpack(">H", read_exactly(f, 2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", read_exactly(f, 5))
+            return width, height
+        f.seek(segment_length - 2, os.SEEK_CUR)
+
+
+def get_png_size(f):
+    f.seek(8)
+    chunk_length, chunk_type, width, height = struct.unpack(">I4sII", read_exactly(f, 16))
+    if chunk_type != b"IHDR":
+        raise ValueError("IHDR chunk not found in %s." % f.name)
+    return width, height
+
+
+def get_image_size(img_path):
+    """Read the size of a JPEG or PNG image from its header, without decoding the image.
+
+    Arguments:
+        img_path {str} -- Path to a .jpg/.jpeg or .png image.
+
+    Returns:
+        tuple -- (width, height) in pixels.
+    """
+    with open(img_path, "rb") as f:
+        signature = f.read(8)
+        if signature[:2] == b"\xff\xd8":
+            return get_jpeg_size(f)
+        if signature == PNG_SIGNATURE:
+            return get_png_size(f)
+    raise ValueError("%s is neither a JPEG nor a PNG image." % img_path)
+
+
+class ImageSizeCache:
+    """Sizes of the images of one directory, each probed only once.
+
+    If cache_file is given, sizes are kept on disk between runs (call save()). A stored size is only reused while
+    the image keeps the same modification time and file size.
+    """
+    def __init__(self, imgs_dir, cache_file=None):
+        self.imgs_dir = imgs_dir
+        self.cache_file = cache_file
+        self.sizes = {}  # img_name: [width, height, mtime_ns, file_size]
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, "r") as f:
+                self.sizes = json.load(f)
+
+    def get_size(self, img_name):
+        stat = os.stat(os.path.join(self.imgs_dir, img_name))
+        entry = self.sizes.get(img_name)
+        if entry is None or entry[2] != stat.st_mtime_ns or entry[3] != stat.st_size:
+            width, height = get_image_size(os.path.join(self.imgs_dir, img_name))
+            entry = [width, height, stat.st_mtime_ns, stat.st_size]
+            self.sizes[img_name] = entry
+        return entry[0], entry[1]
+
+    def save(self):
+        if self.cache_file is not None:
+            with open(self.cache_file, "w") as f:
+                json.dump(self.sizes, f)
@@ -0,0 +1,159 @@
+import os
+import mmap
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+WRITE_BATCH_SIZE = 4096  # Files handed to the thread pool at once, bounds how many texts are held in memory
+WRITE_BUFFER_SIZE = 1 << 20
+PACKED_INDEX_SUFFIX = ".index"
+
+
+def write_text_file(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def write_text_files(files, workers=1):
+    """Write every (path, text) pair of files with a single write per file.
+
+    Arguments:
+        files {iterable} -- (path, text) pairs, consumed lazily.
+        workers {int} -- Threads writing files (file I/O releases the GIL, which helps on network filesystems).
+
+    Returns:
+        int -- Number of files written.
+    """
+    files_written = 0
+    if workers <= 1:
+        for path, text in files:
+            write_text_file(path, text)
+            files_written += 1
+        return files_written
+    files = iter(files)
+    with ThreadPoolExecutor(workers) as executor:
+        while True:
+            batch = list(itertools.islice(files, WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            list(executor.map(write_text_file, *zip(*batch)))
+            files_written += len(batch)
+    return files_written
+
+
+class PackedLabelWriter:
+    """Writes the labels of many frames into a single blob file instead of one small txt file per frame.
+
+    Each frame's text (what its txt file would contain) is appended to the blob, and blob_file + ".index" gets a
+    "frame_name<TAB>offset<TAB>length" line for it. With append=True an existing store is extended, a frame written
+    again replaces the previous one when reading.
+
+    Usage:
+        with PackedLabelWriter(blob_file) as writer:
+            writer.add(frame_name, text)
+    """
+    def __init__(self, blob_file, append=False):
+        self.blob_fp = open(blob_file, 'ab' if append else 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.index_fp = open(blob_file + PACKED_INDEX_SUFFIX, 'a' if append else 'w', buffering=WRITE_BUFFER_SIZE)
+        self.offset = self.blob_fp.tell()
+
+    def add(self, frame_name, text):
+        data = text.encode()
+        self.blob_fp.write(data)
+        self.index_fp.write(f"{frame_name}\t{self.offset}\t{len(data)}\n")
+        self.offset += len(data)
+
+    def close(self):
+        # Blob first, so the index never points past its end
+        self.blob_fp.close()
+        self.index_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PackedLabelReader:
+    """Reads a store written by PackedLabelWriter. The blob is memory mapped, so any frame is read in O(1).
+
+    Usage:
+        with PackedLabelReader(blob_file) as reader:
+            boxes = reader.get_boxes(frame_name)
+    """
+    def __init__(self, blob_file):
+        self.index = {}  # frame_name: (offset, length)
+        with open(blob_file + PACKED_INDEX_SUFFIX, 'r') as f:
+            for line in f:
+                frame_name, offset, length = line.rstrip("\n").split("\t")
+                self.index[frame_name] = (int(offset), int(length))
+        self.blob_fp = open(blob_file, 'rb')
+        if os.fstat(self.blob_fp.fileno()).st_size > 0:
+            self.blob = mmap.mmap(self.blob_fp.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.blob = b""  # Empty files can not be memory mapped
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, frame_name):
+        return frame_name in self.index
+
+    def frame_names(self):
+        return self.index.keys()
+
+    def get_text(self, frame_name):
+        offset, length = self.index[frame_name]
+        return self.blob[offset:offset + length].decode()
+
+    def get_boxes(self, frame_name):
+        """Return the labels of a frame as one list of fields per line, e.g. [["vehicle", "10", "20", "30", "40"]]."""
+        return [line.split() for line in self.get_text(frame_name).splitlines()]
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.blob_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_labels(labels, out_dir=None, workers=1, packed_file=None):
+    """Write (frame_name, text) pairs either as out_dir/<frame_name>.txt files or into the packed_file store.
+
+    Returns:
+        int -- Number of frames written.
+    """
+    if packed_file is None:
+        return write_text_files(((os.path.join(out_dir, frame_name + '.txt'), text) for frame_name, text in labels),
+                                workers)
+    frames_written = 0
+    with PackedLabelWriter(packed_file) as writer:
+        for frame_name, text in labels:
+            writer.add(frame_name, text)
+            frames_written += 1
+    return frames_written
+
+
+def expand_packed_labels(packed_file, out_dir, workers=1):
+    """Write every frame of a packed store as out_dir/<frame_name>.txt, for tools that need one file per frame."""
+    os.makedirs(out_dir, exist_ok=True)
+    with PackedLabelReader(packed_file) as reader:
+        labels = ((frame_name, reader.get_text(frame_name)) for frame_name in reader.frame_names())
+        return write_labels(labels, out_dir, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand a packed label store into one txt file per frame")
+    parser.add_argument("packed_file", type=str, help="packed label store (blob file, its index is next to it)")
+    parser.add_argument("out_dir", type=str, help="dir where the txt files are created")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="threads used to write the files")
+    args = parser.parse_args()
+
+    files_written = expand_packed_labels(args.packed_file, args.out_dir, args.workers)
+    print(f"{files_written} txt files written to {args.out_dir}")
@@ -4,10 +4,11 @@
 
 import sys
 import os
-import json
-import xml.etree.ElementTree as ET
 import glob
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from voc2coco_lib import convert_xml_files, append_xml_files
+
 START_BOUNDING_BOX_ID = 0#1
 PRE_DEFINE_CATEGORIES = None
 # If necessary, pre-define category and its id
@@ -19,124 +20,11 @@ PRE_DEFINE_CATEGORIES = None
 PRE_DEFINE_CATEGORIES = {"vehicle": 1, "pedestrian": 2}
 
 
-def get(root, name):
-    vars = root.findall(name)
-    return vars
-
-
-def get_and_check(root, name, length):
-    vars = root.findall(name)
-    if len(vars) == 0:
-        raise ValueError("Can not find %s in %s." % (name, root.tag))
-    if length > 0 and len(vars) != length:
-        raise ValueError(
-            "The size of %s is supposed to be %d, but is %d."
-            % (name, length, len(vars))
-        )
-    if length == 1:
-        vars = vars[0]
-    return vars
-
-
-def get_filename_as_int(filename):
-    try:
-        filename = filename.replace("\\", "/")
-        filename = os.path.splitext(os.path.basename(filename))[0]
-        return int(filename)
-    except:
-        raise ValueError("Filename %s is supposed to be an integer." % (filename))
-
-
-def get_categories(xml_files):
-    """Generate category name to id mapping from a list of xml files.
-    
-    Arguments:
-        xml_files {list} -- A list of xml file paths.
-    
-    Returns:
-        dict -- category name to id mapping.
-    """
-    classes_names = []
-    for xml_file in xml_files:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        for member in root.findall("object"):
-            classes_names.append(member[0].text)
-    classes_names = list(set(classes_names))
-    classes_names.sort()
-    return {name: i for i, name in enumerate(classes_names)}
-
-
-def convert(xml_files, json_file):
-    json_dict = {"images": [], "type": "instances", "annotations": [], "categories": []}
-    if PRE_DEFINE_CATEGORIES is not None:
-        categories = PRE_DEFINE_CATEGORIES
+def convert(xml_files, json_file, workers=1, cache_file=None, incremental=False):
+    if incremental:
+        append_xml_files(xml_files, json_file, PRE_DEFINE_CATEGORIES, START_BOUNDING_BOX_ID, workers, cache_file)
     else:
-        categories = get_categories(xml_files)
-    bnd_id = START_BOUNDING_BOX_ID
-    for file_id, xml_file in enumerate(xml_files):
-        print(f'file {file_id}/{len(xml_files)}')
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        path = get(root, "path")
-        if len(path) == 1:
-            filename = os.path.basename(path[0].text)
-        elif len(path) == 0:
-            filename = get_and_check(root, "filename", 1).text
-        else:
-            raise ValueError("%d paths found in %s" % (len(path), xml_file))
-        ## The filename must be a number
-        image_id = get_filename_as_int(filename)
-        size = get_and_check(root, "size", 1)
-        width = int(get_and_check(size, "width", 1).text)
-        height = int(get_and_check(size, "height", 1).text)
-        image = {
-            "file_name": filename,
-            "height": height,
-            "width": width,
-            "id": image_id,
-        }
-        json_dict["images"].append(image)
-        ## Currently we do not support segmentation.
-        #  segmented = get_and_check(root, 'segmented', 1).text
-        #  assert segmented == '0'
-        for obj in get(root, "object"):
-            category = get_and_check(obj, "name", 1).text
-            if category not in categories:
-                new_id = len(categories)
-                categories[category] = new_id
-            category_id = categories[category]
-            bndbox = get_and_check(obj, "bndbox", 1)
-            xmin = int(get_and_check(bndbox, "xmin", 1).text) - 1
-            ymin = int(get_and_check(bndbox, "ymin", 1).text) - 1
-            xmax = int(get_and_check(bndbox, "xmax", 1).text)
-            ymax = int(get_and_check(bndbox, "ymax", 1).text)
-            assert xmax > xmin
-            assert ymax > ymin
-            o_width = abs(xmax - xmin)
-            o_height = abs(ymax - ymin)
-            ann = {
-                "area": o_width * o_height,
-                "iscrowd": 0,
-                "image_id": image_id,
-                "bbox": [xmin, ymin, o_width, o_height],
-                "category_id": category_id,
-                "id": bnd_id,
-                "ignore": 0,
-                "segmentation": [],
-            }
-            json_dict["annotations"].append(ann)
-            bnd_id = bnd_id + 1
-
-    for cate, cid in categories.items():
-        cat = {"supercategory": "none", "id": cid, "name": cate}
-        json_dict["categories"].append(cat)
-
-    os.makedirs(os.path.dirname(json_file), exist_ok=True)
-    json_fp = open(json_file, "w")
-    json_str = json.dumps(json_dict)
-    json_fp.write(json_str)
-    json_fp.close()
+        convert_xml_files(xml_files, json_file, PRE_DEFINE_CATEGORIES, START_BOUNDING_BOX_ID, workers, cache_file)
 
 
 if __name__ == "__main__":
@@ -148,11 +36,14 @@ if __name__ == "__main__":
     #parser.add_argument("xml_dir", help="Directory path to xml files.", type=str)
     #parser.add_argument("json_file", help="Output COCO format json file.", type=str)
     #args = parser.parse_args()
+    workers = os.cpu_count()  # Processes used to parse the xml files
     xml_dir = '/media/alan/Seagate Expansion Drive/Data/CARLA_1920x1280/anns_VOC'
     json_file = "/media/alan/Seagate Expansion Drive/Data/CARLA_1920x1280/anns_coco/carla_1920x1280_all_data.json"
+    cache_file = os.path.join(os.path.dirname(json_file), "voc_records_cache.db")  # Unchanged xml files are not parsed again, None disables it
+    incremental = True  # Only adds the xml files that are not in json_file yet, False converts everything again
     xml_files = glob.glob(os.path.join(xml_dir, "*.xml"))
     
 	    # If you want to do train/test split, you can pass a subset of xml files to convert function.
     print("Number of xml files: {}".format(len(xml_files)))
-    convert(xml_files, json_file)
+    convert(xml_files, json_file, workers, cache_file, incremental)
     print("Success: {}".format(json_file))
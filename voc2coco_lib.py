@@ -0,0 +1,430 @@
+#!/usr/bin/python
+
+# Shared Pascal VOC -> COCO conversion used by the convert_voc_to_coco*.py and voc2coco/*.py scripts
+import os
+import json
+import sqlite3
+import bisect
+import tempfile
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+from coco_stream import CocoJsonWriter
+
+PARSE_CHUNK_SIZE = 256
+CACHE_COMMIT_SIZE = 10000
+
+
+def get(root, name):
+    vars = root.findall(name)
+    return vars
+
+
+def get_and_check(root, name, length):
+    vars = root.findall(name)
+    if len(vars) == 0:
+        raise ValueError("Can not find %s in %s." % (name, root.tag))
+    if length > 0 and len(vars) != length:
+        raise ValueError(
+            "The size of %s is supposed to be %d, but is %d."
+            % (name, length, len(vars))
+        )
+    if length == 1:
+        vars = vars[0]
+    return vars
+
+
+def get_filename_as_int(filename):
+    try:
+        filename = filename.replace("\\", "/")
+        filename = os.path.splitext(os.path.basename(filename))[0]
+        return int(filename)
+    except:
+        raise ValueError("Filename %s is supposed to be an integer." % (filename))
+
+
+def index_xml_dir(xml_dir):
+    """Index the xml files of a directory by the integer timestamp they are named after, in a single os.scandir pass.
+
+    Arguments:
+        xml_dir {str} -- Directory with <timestamp>.xml files.
+
+    Returns:
+        tuple -- (timestamps, xml_files) lists, both sorted by timestamp.
+    """
+    entries = []
+    with os.scandir(xml_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".xml") and entry.is_file():
+                entries.append((get_filename_as_int(entry.name), entry.path))
+    entries.sort()
+    return [timestamp for timestamp, _ in entries], [xml_file for _, xml_file in entries]
+
+
+def split_xml_index_by_count(xml_index, frame_counts):
+    """Cut indexed xml files into contiguous ranges of frame_counts[i] frames each, in timestamp order.
+
+    Arguments:
+        xml_index {tuple} -- (timestamps, xml_files), see index_xml_dir.
+        frame_counts {list} -- Number of frames of each range. Frames left after the last range form one more range.
+
+    Returns:
+        list -- len(frame_counts) + 1 lists of xml file paths.
+    """
+    timestamps, xml_files = xml_index
+    if sum(frame_counts) > len(xml_files):
+        raise ValueError("%d frames requested, but only %d xml files were found." % (sum(frame_counts), len(xml_files)))
+    splits = []
+    start = 0
+    for count in frame_counts:
+        splits.append(xml_files[start:start + count])
+        start += count
+    splits.append(xml_files[start:])
+    return splits
+
+
+def split_xml_index_by_timestamp(xml_index, boundaries):
+    """Cut indexed xml files into contiguous ranges at the given timestamps.
+
+    Arguments:
+        xml_index {tuple} -- (timestamps, xml_files), see index_xml_dir.
+        boundaries {list} -- Increasing timestamps, each one is the first timestamp of a new range.
+
+    Returns:
+        list -- len(boundaries) + 1 lists of xml file paths.
+    """
+    timestamps, xml_files = xml_index
+    cuts = [0] + [bisect.bisect_left(timestamps, boundary) for boundary in boundaries] + [len(xml_files)]
+    return [xml_files[start:stop] for start, stop in zip(cuts[:-1], cuts[1:])]
+
+
+def get_categories(classes_names):
+    """Generate category name to id mapping, ids are given in sorted name order.
+
+    Arguments:
+        classes_names {set} -- Category names found on the parsed xml records.
+
+    Returns:
+        dict -- category name to id mapping.
+    """
+    return {name: i for i, name in enumerate(sorted(classes_names))}
+
+
+def parse_xml_file(xml_file):
+    """Parse a single VOC xml file into a plain (picklable) record.
+
+    Arguments:
+        xml_file {str} -- Path to the xml file.
+
+    Returns:
+        tuple -- (filename, image_id, width, height, objects), where objects is a list of
+                 (category, xmin, ymin, xmax, ymax) tuples with xmin/ymin already 0-indexed.
+    """
+    tree = ET.parse(xml_file)
+    root = tree.getroot()
+    path = get(root, "path")
+    if len(path) == 1:
+        filename = os.path.basename(path[0].text)
+    elif len(path) == 0:
+        filename = get_and_check(root, "filename", 1).text
+    else:
+        raise ValueError("%d paths found in %s" % (len(path), xml_file))
+    ## The filename must be a number
+    image_id = get_filename_as_int(filename)
+    size = get_and_check(root, "size", 1)
+    width = int(get_and_check(size, "width", 1).text)
+    height = int(get_and_check(size, "height", 1).text)
+    ## Currently we do not support segmentation.
+    #  segmented = get_and_check(root, 'segmented', 1).text
+    #  assert segmented == '0'
+    objects = []
+    for obj in get(root, "object"):
+        category = get_and_check(obj, "name", 1).text
+        bndbox = get_and_check(obj, "bndbox", 1)
+        xmin = int(get_and_check(bndbox, "xmin", 1).text) - 1
+        ymin = int(get_and_check(bndbox, "ymin", 1).text) - 1
+        xmax = int(get_and_check(bndbox, "xmax", 1).text)
+        ymax = int(get_and_check(bndbox, "ymax", 1).text)
+        assert xmax > xmin
+        assert ymax > ymin
+        objects.append((category, xmin, ymin, xmax, ymax))
+    return filename, image_id, width, height, objects
+
+
+class VocRecordCache:
+    """On-disk sqlite cache of parsed xml records, keyed by file path, mtime and size.
+
+    A cached record is only reused while the xml file keeps the same modification time and size, so edited or
+    re-generated annotations are always parsed again.
+    """
+    def __init__(self, db_filename):
+        if os.path.dirname(db_filename):
+            os.makedirs(os.path.dirname(db_filename), exist_ok=True)
+        self.conn = sqlite3.connect(db_filename)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS voc_records
+                             (path text PRIMARY KEY,
+                             mtime_ns integer,
+                             size integer,
+                             record text)''')
+
+    def has_record(self, xml_file, stat):
+        row = self.conn.execute("SELECT mtime_ns, size FROM voc_records WHERE path=?",
+                                (os.path.abspath(xml_file),)).fetchone()
+        return row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size
+
+    def get_record(self, xml_file, stat):
+        row = self.conn.execute("SELECT mtime_ns, size, record FROM voc_records WHERE path=?",
+                                (os.path.abspath(xml_file),)).fetchone()
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            return None
+        filename, image_id, width, height, objects = json.loads(row[2])
+        return filename, image_id, width, height, [tuple(x) for x in objects]
+
+    def add_records(self, entries):
+        """Store (xml_file, stat, record) entries, replacing outdated ones."""
+        rows = [(os.path.abspath(xml_file), stat.st_mtime_ns, stat.st_size, json.dumps(record))
+                for xml_file, stat, record in entries]
+        self.conn.executemany("INSERT OR REPLACE INTO voc_records VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def iter_parsed_xml_files(xml_files, workers=1, chunk_size=PARSE_CHUNK_SIZE):
+    """Parse xml files one at a time, optionally spread in chunks across a process pool.
+
+    Records are always yielded in the same order as xml_files, so whatever is built from them
+    (image ids, annotation ids, categories) is identical for any number of workers.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths.
+        workers {int} -- Number of parser processes, 1 parses in the current process.
+        chunk_size {int} -- Number of files handed to a worker at a time.
+
+    Yields:
+        tuple -- One record per xml file, see parse_xml_file.
+    """
+    xml_files = list(xml_files)
+    if workers is None or workers <= 1:
+        for xml_idx, xml_file in enumerate(xml_files):
+            print(f'Working on {xml_idx}/{len(xml_files)}')
+            yield parse_xml_file(xml_file)
+        return
+
+    with Pool(workers) as pool:
+        for xml_idx, record in enumerate(pool.imap(parse_xml_file, xml_files, chunksize=chunk_size)):
+            if xml_idx % chunk_size == 0:
+                print(f'Working on {xml_idx}/{len(xml_files)}')
+            yield record
+
+
+def iter_xml_records(xml_files, workers=1, chunk_size=PARSE_CHUNK_SIZE, cache_file=None):
+    """Yield one record per xml file, in order, reading unchanged files from a VocRecordCache when given.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths.
+        workers {int} -- Number of parser processes used for the files that are not cached.
+        chunk_size {int} -- Number of files handed to a worker at a time.
+        cache_file {str} -- sqlite file of a VocRecordCache. None disables caching.
+
+    Yields:
+        tuple -- One record per xml file, see parse_xml_file.
+    """
+    xml_files = list(xml_files)
+    if cache_file is None:
+        yield from iter_parsed_xml_files(xml_files, workers, chunk_size)
+        return
+
+    cache = VocRecordCache(cache_file)
+    try:
+        # Only files that are new or changed since the last run go through the parser
+        stats = [os.stat(x) for x in xml_files]
+        cached = [cache.has_record(x, stat) for x, stat in zip(xml_files, stats)]
+        missing_files = [x for x, is_cached in zip(xml_files, cached) if not is_cached]
+        print(f'{len(xml_files) - len(missing_files)}/{len(xml_files)} xml files found on cache {cache_file}')
+        parsed_records = iter_parsed_xml_files(missing_files, workers, chunk_size)
+        new_entries = []
+        for xml_file, stat, is_cached in zip(xml_files, stats, cached):
+            if is_cached:
+                yield cache.get_record(xml_file, stat)
+                continue
+            record = next(parsed_records)
+            new_entries.append((xml_file, stat, record))
+            if len(new_entries) >= CACHE_COMMIT_SIZE:
+                cache.add_records(new_entries)
+                new_entries = []
+            yield record
+        parsed_records.close()
+        cache.add_records(new_entries)
+    finally:
+        cache.close()
+
+
+def parse_xml_files(xml_files, workers=1, chunk_size=PARSE_CHUNK_SIZE, cache_file=None):
+    """Same as iter_xml_records, but returns every record at once in a list."""
+    return list(iter_xml_records(xml_files, workers, chunk_size, cache_file))
+
+
+def write_coco_json(records, json_file, categories=None, start_bbox_id=0, coco_data=None):
+    """Write parsed xml records into a single COCO json file.
+
+    The json is streamed to disk while the records are consumed: images are written right away and annotations are
+    spooled to a temporary file until the categories are known, so memory use does not grow with the dataset.
+
+    Arguments:
+        records {iterable} -- Records as produced by parse_xml_file, in the order they should be written.
+        json_file {str} -- Output COCO json file.
+        categories {dict} -- Pre-defined category name to id mapping. Unknown names found on the records are
+                             appended to it. If None, the mapping is generated from the records.
+        start_bbox_id {int} -- Id given to the first annotation.
+        coco_data {dict} -- Existing COCO data whose images and annotations are written before the new ones.
+    """
+    os.makedirs(os.path.dirname(json_file), exist_ok=True)
+    classes_names = set()
+    with CocoJsonWriter(json_file) as writer, \
+            tempfile.TemporaryFile("w+", dir=os.path.dirname(json_file)) as anns_spool:
+        writer.begin_list("images")
+        if coco_data is not None:
+            writer.write_items(coco_data["images"])
+        for filename, image_id, width, height, objects in records:
+            image = {
+                "file_name": filename,
+                "height": height,
+                "width": width,
+                "id": image_id,
+            }
+            writer.write_item(image)
+            for obj in objects:
+                classes_names.add(obj[0])
+                anns_spool.write(json.dumps([image_id, *obj]) + "\n")
+        writer.end_list()
+        writer.write_value("type", "instances")
+
+        if categories is None:
+            categories = get_categories(classes_names)
+        writer.begin_list("annotations")
+        if coco_data is not None:
+            writer.write_items(coco_data["annotations"])
+        bnd_id = start_bbox_id
+        anns_spool.seek(0)
+        for line in anns_spool:
+            image_id, category, xmin, ymin, xmax, ymax = json.loads(line)
+            if category not in categories:
+                new_id = len(categories)
+                categories[category] = new_id
+            category_id = categories[category]
+            o_width = abs(xmax - xmin)
+            o_height = abs(ymax - ymin)
+            ann = {
+                "area": o_width * o_height,
+                "iscrowd": 0,
+                "image_id": image_id,
+                "bbox": [xmin, ymin, o_width, o_height],
+                "category_id": category_id,
+                "id": bnd_id,
+                "ignore": 0,
+                "segmentation": [],
+            }
+            writer.write_item(ann)
+            bnd_id = bnd_id + 1
+        writer.end_list()
+
+        writer.begin_list("categories")
+        for cate, cid in categories.items():
+            cat = {"supercategory": "none", "id": cid, "name": cate}
+            writer.write_item(cat)
+        writer.end_list()
+
+
+def convert_xml_files(xml_files, json_file, categories=None, start_bbox_id=0, workers=1, cache_file=None):
+    """Convert a list of VOC xml files into a single COCO json file.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths.
+        json_file {str} -- Output COCO json file.
+        categories {dict} -- Pre-defined category name to id mapping. Unknown names found on the xml files are
+                             appended to it. If None, the mapping is generated from the xml files.
+        start_bbox_id {int} -- Id given to the first annotation.
+        workers {int} -- Number of processes used to parse the xml files.
+        cache_file {str} -- sqlite file used to cache parsed xml files between runs (see VocRecordCache).
+    """
+    records = iter_xml_records(xml_files, workers, cache_file=cache_file)
+    write_coco_json(records, json_file, categories, start_bbox_id)
+
+
+def append_xml_files(xml_files, json_file, categories=None, start_bbox_id=0, workers=1, cache_file=None):
+    """Add the xml files that are not in an existing COCO json file yet, without converting everything again.
+
+    An xml file is considered present when an image of json_file has the same file_name apart from the extension
+    (e.g. 1604595240.xml -> 1604595240.jpg). Only the new xml files are parsed, annotation ids continue from the
+    highest id of the file and categories keep their ids. The file is rewritten through a temporary file, so it is
+    never left half written.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths, usually every xml file of the annotations directory.
+        json_file {str} -- COCO json file to update. It is created as with convert_xml_files if it does not exist.
+        categories {dict} -- Category name to id mapping used only when json_file does not exist yet.
+        start_bbox_id {int} -- Id given to the first annotation when json_file has none.
+        workers {int} -- Number of processes used to parse the xml files.
+        cache_file {str} -- sqlite file used to cache parsed xml files between runs (see VocRecordCache).
+    """
+    if not os.path.exists(json_file):
+        convert_xml_files(xml_files, json_file, categories, start_bbox_id, workers, cache_file)
+        return
+
+    with open(json_file, "r") as f:
+        coco_data = json.load(f)
+    present_names = {os.path.splitext(x["file_name"])[0] for x in coco_data["images"]}
+    new_xml_files = [x for x in xml_files if os.path.splitext(os.path.basename(x))[0] not in present_names]
+    print(f"{len(new_xml_files)} new xml files out of {len(xml_files)}")
+    if not new_xml_files:
+        return
+
+    categories = {x["name"]: x["id"] for x in coco_data["categories"]}
+    if coco_data["annotations"]:
+        start_bbox_id = max(x["id"] for x in coco_data["annotations"]) + 1
+    records = iter_xml_records(new_xml_files, workers, cache_file=cache_file)
+    tmp_json_file = json_file + ".tmp"
+    write_coco_json(records, tmp_json_file, categories, start_bbox_id, coco_data)
+    os.replace(tmp_json_file, json_file)
+
+
+def load_xml_records(xml_files, workers=1, cache_file=None):
+    """Parse every xml file once into an in-memory table, so it can be written into any number of splits.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths.
+        workers {int} -- Number of processes used to parse the xml files.
+        cache_file {str} -- sqlite file used to cache parsed xml files between runs (see VocRecordCache).
+
+    Returns:
+        dict -- xml file path to record, see parse_xml_file.
+    """
+    xml_files = list(dict.fromkeys(xml_files))
+    return dict(zip(xml_files, iter_xml_records(xml_files, workers, cache_file=cache_file)))
+
+
+def convert_xml_splits(splits, categories=None, start_bbox_id=0, workers=1, cache_file=None, share_categories=False):
+    """Convert several (possibly overlapping) lists of VOC xml files into one COCO json file each.
+
+    Every xml file is parsed only once, no matter in how many splits it shows up (e.g. the train sets of k folds).
+    Each json file is the same as what convert_xml_files would write for its list of xml files, given its own copy of
+    categories (unless share_categories).
+
+    Arguments:
+        splits {dict} -- Output COCO json file to the list of xml file paths that go into it.
+        categories {dict} -- Pre-defined category name to id mapping used by every split. If None, each split
+                             generates its own mapping from its xml files.
+        start_bbox_id {int} -- Id given to the first annotation of each split.
+        workers {int} -- Number of processes used to parse the xml files.
+        cache_file {str} -- sqlite file used to cache parsed xml files between runs (see VocRecordCache).
+        share_categories {bool} -- Pass the same categories dict to every split, so unknown names found on one split
+                                   are also listed (with the same id) on the following ones.
+    """
+    splits = {json_file: list(xml_files) for json_file, xml_files in splits.items()}
+    records = load_xml_records((x for xml_files in splits.values() for x in xml_files), workers, cache_file)
+    for json_file, xml_files in splits.items():
+        split_categories = categories if share_categories or categories is None else dict(categories)
+        write_coco_json((records[x] for x in xml_files), json_file, split_categories, start_bbox_id)
+        print("Success: {}".format(json_file))
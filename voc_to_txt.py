@@ -1,32 +1,122 @@
-import xml
-import xml.etree.ElementTree as ET
 import os
 import glob
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from functools import partial
+from multiprocessing import Pool
+
+from label_files import PackedLabelWriter
+
+BNDBOX_TAGS = ('xmin', 'ymin', 'xmax', 'ymax')
+EXPORT_CHUNK_SIZE = 256
+
+
+def parse_objects(xml_file):
+    """Read the objects of a VOC xml file as (name, xmin, ymin, xmax, ymax) tuples, with the coordinates as written."""
+    objects = []
+    for obj in ET.parse(xml_file).getroot().iter('object'):
+        bndbox = obj.find('bndbox')
+        objects.append((obj.findtext('name'), *(bndbox.findtext(x) for x in BNDBOX_TAGS)))
+    return objects
+
+
+def format_objects(objects, layout, class_ids=None):
+    # "mAP": name xmin ymin xmax ymax, the ground truth layout of the mAP tool (github.com/Cartucho/mAP)
+    # "plain": class_id xmin ymin xmax ymax, with class ids given by the order of the classes list
+    if layout == 'mAP':
+        return "".join(f"{name} {xmin} {ymin} {xmax} {ymax}\n" for name, xmin, ymin, xmax, ymax in objects)
+    return "".join(f"{class_ids[name]} {xmin} {ymin} {xmax} {ymax}\n" for name, xmin, ymin, xmax, ymax in objects)
+
+
+def format_xml_file(xml_file, layout, class_ids=None):
+    # (frame_name, text, number of objects) of one xml file, for the packed store
+    objects = parse_objects(xml_file)
+    if layout == 'plain':
+        for obj in objects:
+            if obj[0] not in class_ids:
+                raise ValueError("Class %s of %s is not in the classes list." % (obj[0], xml_file))
+    frame_name = os.path.basename(xml_file).replace('.xml', '')
+    return frame_name, format_objects(objects, layout, class_ids), len(objects)
+
+
+def export_xml_file(xml_file, out_dir, layout, class_ids=None):
+    frame_name, text, objects = format_xml_file(xml_file, layout, class_ids)
+    with open(os.path.join(out_dir, frame_name + '.txt'), 'w') as f:
+        f.write(text)
+    return objects
+
+
+def iter_exported_files(export, xml_files, workers=1, chunk_size=EXPORT_CHUNK_SIZE):
+    # Files are independent, so with a pool they are yielded in whatever order they are done
+    if workers <= 1:
+        yield from map(export, xml_files)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(export, xml_files, chunksize=chunk_size)
+
+
+def export_xml_files(xml_files, out_dir, layout='mAP', classes=None, workers=1, chunk_size=EXPORT_CHUNK_SIZE,
+                     packed_file=None):
+    """Convert VOC xml files into one txt file each (or into one packed store), spread over a process pool.
+
+    Arguments:
+        xml_files {list} -- A list of xml file paths.
+        out_dir {str} -- Directory of the txt files, named after the xml files.
+        layout {str} -- "mAP" (name xmin ymin xmax ymax) or "plain" (class_id xmin ymin xmax ymax).
+        classes {list} -- Class names, their position is the class id of the "plain" layout. Objects of any other
+                          class raise a ValueError.
+        workers {int} -- Number of processes parsing/writing files.
+        chunk_size {int} -- Files handed to a process at once.
+        packed_file {str} -- If given, the texts are sent back to this process and written into this packed label
+                             store (see label_files.py) instead of out_dir.
+    """
+    if layout not in ('mAP', 'plain'):
+        raise ValueError("Unknown layout %s." % layout)
+    if layout == 'plain' and classes is None:
+        raise ValueError("The plain layout needs the list of classes.")
+    class_ids = {name: idx for idx, name in enumerate(classes)} if classes is not None else None
+    if packed_file is None:
+        os.makedirs(out_dir, exist_ok=True)
+        export = partial(export_xml_file, out_dir=out_dir, layout=layout, class_ids=class_ids)
+        writer = None
+    else:
+        export = partial(format_xml_file, layout=layout, class_ids=class_ids)
+        writer = PackedLabelWriter(packed_file)
+
+    start = time.perf_counter()
+    objects_exported = 0
+    try:
+        for file_idx, result in enumerate(iter_exported_files(export, xml_files, workers, chunk_size), 1):
+            if writer is not None:
+                frame_name, text, result = result
+                writer.add(frame_name, text)
+            objects_exported += result
+            if file_idx % chunk_size == 0:
+                print(f'Processed files: {file_idx}/{len(xml_files)}')
+    finally:
+        # Frames exported before an error are still flushed to the packed store
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    print(f'{len(xml_files)} files ({objects_exported} objects) exported in {elapsed:.1f}s, '
+          f'{len(xml_files) / max(elapsed, 1e-9):.0f} files/s')
 
 
 if __name__ == "__main__":
-    xml_dir = '/home/aiss-v100/workspace/alan/Mestrado/dataset/carla_high_res/anns'
-    out_dir = '/home/aiss-v100/workspace/alan/Mestrado/dataset/carla_high_res/anns_txt'
-
-    xml_files = glob.glob(os.path.join(xml_dir, '*.xml'))
-    for file_idx, file in enumerate(xml_files):
-        out_file = os.path.basename(file).replace('.xml', '.txt')
-        tree = ET.parse(file)
-        root = tree.getroot()
-        xml_data = {'name': [], 'xmin': [], 'ymin': [], 'xmax': [], 'ymax': []}
-        # tags = {}
-        for idx, elem in enumerate(tree.iter()):
-            # tags[idx] = [elem.tag, elem.text]
-            # print('elem.tag', elem.tag)
-            if elem.tag in xml_data:
-                xml_data[elem.tag].append(elem.text)
-
-        with open(os.path.join(out_dir, out_file), 'w') as f:
-            for object in range(len(xml_data['name'])):
-                f.write(xml_data['name'][object] + ' ')
-                f.write(xml_data['xmin'][object] + ' ')
-                f.write(xml_data['ymin'][object] + ' ')
-                f.write(xml_data['xmax'][object] + ' ')
-                f.write(xml_data['ymax'][object] + '\n')
-
-        print(f'Processed files: {file_idx}/{len(xml_files)}')
+    parser = argparse.ArgumentParser(description="Convert VOC xml files into txt files (one per xml file)")
+    parser.add_argument("xml_dir", type=str, help="dir with the VOC xml files")
+    parser.add_argument("out_dir", type=str, help="dir where the txt files are created")
+    parser.add_argument("--layout", type=str, choices=["mAP", "plain"], default="mAP",
+                        help="\"mAP\": name xmin ymin xmax ymax, as expected by the mAP tool;"
+                             "\"plain\": class_id xmin ymin xmax ymax, with ids from --classes")
+    parser.add_argument("--classes", type=str, nargs="+", default=None, help="class names in class id order, e.g."
+                                                                             " vehicle pedestrian")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes used to export the files")
+    parser.add_argument("--packed", action="store_true", help="write a single packed label store, <out_dir>.labels "
+                                                              "and its index, instead of one txt file per xml file")
+    args = parser.parse_args()
+
+    xml_files = glob.glob(os.path.join(args.xml_dir, '*.xml'))
+    packed_file = os.path.normpath(args.out_dir) + '.labels' if args.packed else None
+    export_xml_files(xml_files, args.out_dir, args.layout, args.classes, args.workers, packed_file=packed_file)
@@ -10,6 +10,8 @@ from get_data_from_tf_record import get_img_and_bbox, get_lidar_data
 import tensorflow as tf
 #tf.enable_eager_execution()
 from waymo_open_dataset import dataset_pb2 as open_dataset
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from label_files import PackedLabelWriter
 
 
 class DatabaseManager:
@@ -49,15 +51,21 @@ class DatabaseManager:
 
 
 class DatasetCreator:
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, packed_labels=False):
         self.output_dir = output_dir
         self.rgb_dir = os.path.join(output_dir, 'imgs_jpg')
         self.bb_dir = os.path.join(output_dir, 'anns_custom')
         self.lidar_dir = os.path.join(output_dir, 'depth_npy')
         os.makedirs(output_dir, exist_ok=True)
         os.makedirs(self.rgb_dir, exist_ok=True)
-        os.makedirs(self.bb_dir, exist_ok=True)
         os.makedirs(self.lidar_dir, exist_ok=True)
+        # Packed labels go into a single anns_custom.labels store (appended to by every tar) instead of one txt file
+        # per camera, see label_files.py to expand it back into anns_custom
+        self.bb_store = None
+        if packed_labels:
+            self.bb_store = PackedLabelWriter(self.bb_dir + '.labels', append=True)
+        else:
+            os.makedirs(self.bb_dir, exist_ok=True)
 
     def save_rgb_data(self, img_array, frame_name):
         for camera_name in img_array:
@@ -66,17 +74,26 @@ class DatasetCreator:
     def save_bb_data(self, bb_data, frame_name):
         # BB Format: object_class xmin ymin xmax ymax difficulty_level tracking_level
         for camera_name in bb_data:
-            with open(os.path.join(self.bb_dir, frame_name + "_" + camera_name) + ".txt", 'w') as f:
-                if bb_data[camera_name]:
-                    for object_class in bb_data[camera_name]:
-                        for object_data in bb_data[camera_name][object_class]:
-                            object_data = [str(x) for x in object_data]
-                            f.write(object_class + ' ' + object_data[0] + ' ' + object_data[1] + ' ' + object_data[2] + ' '
-                                    + object_data[3] + ' ' + object_data[4] + ' ' + object_data[5] + '\n')
+            lines = []
+            if bb_data[camera_name]:
+                for object_class in bb_data[camera_name]:
+                    for object_data in bb_data[camera_name][object_class]:
+                        object_data = [str(x) for x in object_data]
+                        lines.append(object_class + ' ' + object_data[0] + ' ' + object_data[1] + ' ' + object_data[2] + ' '
+                                     + object_data[3] + ' ' + object_data[4] + ' ' + object_data[5] + '\n')
+            if self.bb_store is not None:
+                self.bb_store.add(frame_name + "_" + camera_name, "".join(lines))
+            else:
+                with open(os.path.join(self.bb_dir, frame_name + "_" + camera_name) + ".txt", 'w') as f:
+                    f.write("".join(lines))
 
     def save_lidar_data(self, lidar_data, frame_name):
         np.save(os.path.join(self.lidar_dir, frame_name) + ".npy", lidar_data)
 
+    def close(self):
+        if self.bb_store is not None:
+            self.bb_store.close()
+
 
 class TarManager:
     def __init__(self, tar_file_path, tmp_top_dir):
@@ -95,8 +112,8 @@ class TarManager:
         self.tmp_dir.cleanup()
 
 
-def create_filtered_data(tar_file_path, output_dir):
-    DatasetFiltered = DatasetCreator(output_dir)
+def create_filtered_data(tar_file_path, output_dir, packed_labels=False):
+    DatasetFiltered = DatasetCreator(output_dir, packed_labels)
     Database = DatabaseManager(os.path.join(output_dir, 'annotation_metadata.db'))
     invalid_bb_frames = {}
 
@@ -139,10 +156,11 @@ def create_filtered_data(tar_file_path, output_dir):
             if frame_idx == 0:
                 Database.add_start_or_finish(frame_name, frame_idx)
         Database.add_start_or_finish(frame_name, frame_idx)
+    DatasetFiltered.close()
     TarObject.clean_tmp_dir()  # Erases temporary TFRECORD files
 
 
-def download_and_extract_data(split, dataset_version, out_dir):
+def download_and_extract_data(split, dataset_version, out_dir, packed_labels=False):
     splits_len = {"training": 32, "validation": 8}
 
     for split in splits:
@@ -157,7 +175,7 @@ def download_and_extract_data(split, dataset_version, out_dir):
     
             tar_file_path = os.path.join(out_dir, tar_filename)
             print(f'Working on tar {tar_id}/{len_tars} {split}')
-            create_filtered_data(tar_file_path, out_dir)
+            create_filtered_data(tar_file_path, out_dir, packed_labels)
             os.remove(tar_file_path)
 
 
@@ -165,6 +183,7 @@ if __name__ == "__main__":
     out_dir = "/media/aiss-v100/Naotop_1TB/data/WAYMO_v120"
     dataset_version = '1_2_0'
     splits = ["training", "validation"]
-    download_and_extract_data(splits, dataset_version, out_dir)
+    packed_labels = False  # Save the bounding boxes into one anns_custom.labels store instead of one txt per camera
+    download_and_extract_data(splits, dataset_version, out_dir, packed_labels)
 
 